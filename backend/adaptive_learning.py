@@ -1,17 +1,47 @@
 import os
+import time
+import heapq
 import random
-from collections import defaultdict
+import struct
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timezone
 from openai import OpenAI, OpenAIError
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, ASCENDING
+from pymongo.errors import PyMongoError
+from prompt_prep import prepare_solution_prompt, count_tokens
+from cache_coherence import publish_invalidation
 
-# Initialize the OpenAI client using the API key from the environment
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# The OpenAI client is created on first use, so importing this module (e.g. for the
+# review scheduler) does not require an API key.
+_openai_client = None
+
+def get_openai_client():
+    """Create the OpenAI client from the environment's API key on first use."""
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return _openai_client
 
 # Connect to MongoDB and define collections
 mongo_client = MongoClient("mongodb://localhost:27017")
 db = mongo_client['amc10_test']
-adaptive_collection = db['adaptive_learning']
+# The collection app.py serves adaptive data from; the generator writes to the same one
+# so its cache invalidations reach the app.
+ADAPTIVE_COLLECTION_NAME = 'adaptive_learning_o3'
+adaptive_collection = db[ADAPTIVE_COLLECTION_NAME]
 raw_solutions_collection = db['solutions']
+review_schedules_collection = db['review_schedules']
+
+# Student schedules one app process keeps in memory between requests (see ReviewScheduleCache).
+REVIEW_CACHE_STUDENTS = 2000
+
+# Placeholders saved when an OpenAI call fails during generate_adaptive_for_all.
+SUMMARY_ERROR_TEXT = "Error generating solution summary."
+FOLLOWUP_ERROR_TEXT = "Error generating follow-up question."
+
+class AdaptiveGenerationError(Exception):
+    """Raised by pre_generate_adaptive_data(raise_on_error=True) when an OpenAI call failed."""
 # problems_collection is not used for adaptive generation now
 
 # (Optional) Retain the RLAgent for future use.
@@ -41,6 +71,350 @@ class RLAgent:
         new_q = current_q + self.alpha * (reward + self.gamma * next_max - current_q)
         self.q_table[(state, action)] = new_q
 
+class SpacedRepetitionScheduler:
+    """
+    SM-2 style review scheduler for missed problems.
+    Each student has a dict of cards {card_key: [due, interval_days, ease, reps]} and a
+    min-heap of (due, card_key) entries, so finding the next due review is O(log n).
+    A card enters the schedule the first time the student misses that problem.
+    Rescheduling pushes a new heap entry; outdated entries are skipped when they reach
+    the top and the heap is rebuilt once they outnumber the live cards.
+    """
+    DAY_SECONDS = 86400
+    # Persisted per card as 12 packed bytes: due (uint32 epoch seconds),
+    # interval (float32 days), ease x 100 (uint16), reps (uint16).
+    CARD_STRUCT = struct.Struct("<IfHH")
+
+    def __init__(self, default_ease=2.5, min_ease=1.3):
+        self.default_ease = default_ease
+        self.min_ease = min_ease
+        self.cards = defaultdict(dict)
+        self.heaps = defaultdict(list)
+
+    def _schedule(self, card, correct, now):
+        """Apply one SM-2 update to a card in place."""
+        due, interval, ease, reps = card
+        quality = 4 if correct else 1
+        if correct:
+            reps += 1
+            if reps == 1:
+                interval = 1.0
+            elif reps == 2:
+                interval = 6.0
+            else:
+                interval = interval * ease
+        else:
+            reps = 0
+            interval = 1.0
+        ease = max(self.min_ease, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        card[:] = [int(now + interval * self.DAY_SECONDS), interval, ease, reps]
+
+    def _apply(self, student_id, card_key, correct, now):
+        """Update card state without touching the heap. Returns the card or None."""
+        cards = self.cards[student_id]
+        card = cards.get(card_key)
+        if card is None:
+            if correct:
+                # Only missed problems are scheduled for review.
+                return None
+            card = [int(now), 0.0, self.default_ease, 0]
+            cards[card_key] = card
+        self._schedule(card, correct, now)
+        return card
+
+    def review(self, student_id, card_key, correct, now=None):
+        """
+        Record an answer and reschedule the card.
+        Returns the new due time, or None if the problem is not being reviewed.
+        """
+        now = time.time() if now is None else now
+        card = self._apply(student_id, card_key, correct, now)
+        if card is None:
+            return None
+        heap = self.heaps[student_id]
+        heapq.heappush(heap, (card[0], card_key))
+        if len(heap) > 2 * len(self.cards[student_id]) + 16:
+            self._rebuild_heap(student_id)
+        return card[0]
+
+    def _rebuild_heap(self, student_id):
+        heap = [(card[0], key) for key, card in self.cards[student_id].items()]
+        heapq.heapify(heap)
+        self.heaps[student_id] = heap
+
+    def _peek(self, student_id):
+        """Drop outdated entries and return the earliest live (due, card_key), or None."""
+        heap = self.heaps.get(student_id)
+        cards = self.cards.get(student_id, {})
+        while heap:
+            due, key = heap[0]
+            card = cards.get(key)
+            if card is not None and card[0] == due:
+                return heap[0]
+            heapq.heappop(heap)
+        return None
+
+    def next_due(self, student_id, now=None):
+        """
+        Return the card_key of the earliest review that is due, or None.
+        """
+        now = time.time() if now is None else now
+        entry = self._peek(student_id)
+        if entry is None or entry[0] > now:
+            return None
+        return entry[1]
+
+    def due_reviews(self, student_id, now=None, limit=10):
+        """
+        Return up to limit due card_keys in due order, without changing the schedule.
+        """
+        now = time.time() if now is None else now
+        if self._peek(student_id) is None:
+            return []
+        due = []
+        for due_at, key in heapq.nsmallest(limit * 2 + 16, self.heaps[student_id]):
+            if due_at > now or len(due) >= limit:
+                break
+            card = self.cards[student_id].get(key)
+            if card is not None and card[0] == due_at and key not in due:
+                due.append(key)
+        return due
+
+    def load_attempts(self, attempts, on_loaded=None):
+        """
+        Bulk-load schedules from attempt history.
+        attempts is an iterable of dicts with student_id, card_key, is_correct and a
+        timestamp (epoch seconds), grouped by student and in time order within each
+        student, e.g. a cursor sorted on (student_id, created_at). It is consumed as a
+        stream: when a student's attempts end, their heap is built once with heapify
+        (O(n)) and on_loaded(student_id) is called, so a caller that persists and evicts
+        each student there only holds one schedule in memory at a time.
+        Returns the number of students with a schedule.
+        """
+        loaded = 0
+        finished = set()
+        student_id = last_timestamp = None
+
+        def finish(student_id):
+            finished.add(student_id)
+            if not self.cards.get(student_id):
+                # Only correct answers: nothing to review.
+                self.evict(student_id)
+                return 0
+            self._rebuild_heap(student_id)
+            if on_loaded is not None:
+                on_loaded(student_id)
+            return 1
+
+        for attempt in attempts:
+            if attempt["student_id"] != student_id:
+                if student_id is not None:
+                    loaded += finish(student_id)
+                student_id = attempt["student_id"]
+                if student_id in finished:
+                    raise ValueError(f"Attempts for student {student_id} are not grouped together.")
+                last_timestamp = None
+            if last_timestamp is not None and attempt["timestamp"] < last_timestamp:
+                raise ValueError(f"Attempts for student {student_id} are not in time order.")
+            last_timestamp = attempt["timestamp"]
+            self._apply(student_id, attempt["card_key"], attempt["is_correct"], attempt["timestamp"])
+        if student_id is not None:
+            loaded += finish(student_id)
+        return loaded
+
+    @staticmethod
+    def card_field(card_key):
+        """Escape a card key for use as a MongoDB field name (no "." or "$")."""
+        return card_key.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+    @staticmethod
+    def card_key_from_field(field):
+        return field.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+    def pack_card(self, student_id, card_key):
+        due, interval, ease, reps = self.cards[student_id][card_key]
+        return self.CARD_STRUCT.pack(due, interval, int(round(ease * 100)), min(reps, 65535))
+
+    def to_doc(self, student_id):
+        """
+        Compact persistence: {"cards": {card_field: 12 packed bytes}}. Keeping each card
+        in its own field lets workers update single cards with $set.
+        """
+        cards = self.cards.get(student_id, {})
+        return {
+            "_id": student_id,
+            "cards": {self.card_field(key): self.pack_card(student_id, key) for key in cards}
+        }
+
+    def load_doc(self, doc):
+        """
+        Restore one student's schedule from a document produced by to_doc, replacing any
+        copy already in memory.
+        """
+        student_id = doc["_id"]
+        cards = {}
+        for field, packed in doc.get("cards", {}).items():
+            due, interval, ease, reps = self.CARD_STRUCT.unpack(packed)
+            cards[self.card_key_from_field(field)] = [due, interval, ease / 100.0, reps]
+        self.cards[student_id] = cards
+        self._rebuild_heap(student_id)
+        return student_id
+
+    def evict(self, student_id):
+        """Drop a student's schedule from memory."""
+        self.cards.pop(student_id, None)
+        self.heaps.pop(student_id, None)
+
+def save_review_schedule(scheduler, student_id):
+    """
+    Overwrite one student's whole review schedule in db['review_schedules'].
+    Only used for offline rebuilds; live updates go through save_review_card.
+    Bumps the document's version so app processes drop their cached copy.
+    """
+    review_schedules_collection.update_one(
+        {"_id": student_id},
+        {"$set": {"cards": scheduler.to_doc(student_id)["cards"]}, "$inc": {"version": 1}},
+        upsert=True
+    )
+
+def save_review_card(student_id, card_key, packed_card):
+    """
+    Persist a single packed card (see SpacedRepetitionScheduler.pack_card) with $set, so
+    workers updating different cards of the same student never overwrite each other.
+    Returns the document's new version.
+    """
+    doc = review_schedules_collection.find_one_and_update(
+        {"_id": student_id},
+        {
+            "$set": {f"cards.{SpacedRepetitionScheduler.card_field(card_key)}": packed_card},
+            "$inc": {"version": 1}
+        },
+        projection={"version": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["version"]
+
+def load_review_schedule(scheduler, student_id):
+    """
+    (Re)load a student's schedule from the database into the scheduler.
+    Returns the document's version, or None if the student has no schedule.
+    """
+    doc = review_schedules_collection.find_one({"_id": student_id})
+    if doc:
+        scheduler.load_doc(doc)
+        return doc.get("version", 0)
+    scheduler.evict(student_id)
+    return None
+
+class ReviewScheduleCache:
+    """
+    Bounded LRU of student schedules for one app process, so a request costs a heap
+    operation instead of reloading and re-heapifying the student's whole schedule.
+    Every write bumps the schedule document's version. A request first reads only that
+    version (a projected _id lookup) and reloads the schedule if another process saved
+    since; this process's own saves keep its copy current.
+    """
+    def __init__(self, capacity=REVIEW_CACHE_STUDENTS):
+        self.scheduler = SpacedRepetitionScheduler()
+        self.capacity = capacity
+        self.versions = OrderedDict()  # student_id -> version of the copy in memory
+        self.lock = threading.Lock()
+
+    def _remember(self, student_id, version):
+        """Record the version now in memory and drop the least recently used students."""
+        self.versions[student_id] = version
+        self.versions.move_to_end(student_id)
+        while len(self.versions) > self.capacity:
+            oldest, _ = self.versions.popitem(last=False)
+            self.scheduler.evict(oldest)
+
+    def _forget(self, student_id):
+        self.versions.pop(student_id, None)
+        self.scheduler.evict(student_id)
+
+    def _refresh(self, student_id):
+        """Make sure the in-memory schedule matches the stored version."""
+        doc = review_schedules_collection.find_one({"_id": student_id}, {"version": 1})
+        version = doc.get("version", 0) if doc else None
+        with self.lock:
+            if student_id in self.versions and self.versions[student_id] == version:
+                self.versions.move_to_end(student_id)
+                return
+            if version is None:
+                self._forget(student_id)
+                return
+        scheduler = SpacedRepetitionScheduler()
+        version = load_review_schedule(scheduler, student_id)
+        with self.lock:
+            if version is None:
+                self._forget(student_id)
+                return
+            if self.versions.get(student_id, -1) > version:
+                # Another request already installed a newer copy.
+                return
+            self.scheduler.cards[student_id] = scheduler.cards[student_id]
+            self.scheduler.heaps[student_id] = scheduler.heaps[student_id]
+            self._remember(student_id, version)
+
+    def next_due(self, student_id, now=None):
+        """Return the card_key of the student's earliest due review, or None."""
+        self._refresh(student_id)
+        with self.lock:
+            return self.scheduler.next_due(student_id, now)
+
+    def review(self, student_id, card_key, correct, now=None):
+        """
+        Record an answer, persist the rescheduled card and return its new due time
+        (None if the problem is not being reviewed).
+        """
+        self._refresh(student_id)
+        with self.lock:
+            due = self.scheduler.review(student_id, card_key, correct, now)
+            if due is None:
+                return None
+            packed_card = self.scheduler.pack_card(student_id, card_key)
+            cached = self.versions.get(student_id)
+        version = save_review_card(student_id, card_key, packed_card)
+        with self.lock:
+            if version == (cached or 0) + 1 and self.versions.get(student_id) == cached:
+                # Nobody else wrote in between, so the copy in memory is current.
+                self._remember(student_id, version)
+            else:
+                self._forget(student_id)
+        return due
+
+def rebuild_review_schedules(attempts_collection):
+    """
+    Rebuild every student's review schedule from the raw attempt log and persist them.
+    Card keys are "year|contest|problem_number", matching the stats documents.
+    The log is read sorted by (student_id, created_at) on the server and each student is
+    saved and evicted as soon as their attempts end, so memory holds one schedule at a time.
+    """
+    attempts_collection.create_index([("student_id", ASCENDING), ("created_at", ASCENDING)])
+    scheduler = SpacedRepetitionScheduler()
+    cursor = attempts_collection.find(
+        {},
+        {"student_id": 1, "year": 1, "contest": 1, "problem_number": 1, "is_correct": 1, "created_at": 1}
+    ).sort([("student_id", ASCENDING), ("created_at", ASCENDING)])
+    attempts = (
+        {
+            "student_id": a["student_id"],
+            "card_key": f"{a['year']}|{a['contest']}|{a['problem_number']}",
+            "is_correct": a.get("is_correct", False),
+            "timestamp": a["created_at"].replace(tzinfo=timezone.utc).timestamp()
+        }
+        for a in cursor
+    )
+
+    def save_and_evict(student_id):
+        save_review_schedule(scheduler, student_id)
+        scheduler.evict(student_id)
+
+    count = scheduler.load_attempts(attempts, on_loaded=save_and_evict)
+    print(f"Rebuilt review schedules for {count} students.")
+    return count
+
 def generate_solution_summary(raw_solution, variant_label):
     """
     Generate a concise, smart, and fast summary of the raw solution.
@@ -53,7 +427,8 @@ def generate_solution_summary(raw_solution, variant_label):
         "Concise Summary:"
     )
     try:
-        response = client.chat.completions.create(
+        started = time.time()
+        response = get_openai_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are an expert AMC 10 math tutor."},
@@ -62,21 +437,28 @@ def generate_solution_summary(raw_solution, variant_label):
             max_tokens=150,
             temperature=0.5,
         )
+        usage = getattr(response, "usage", None)
+        prompt_tokens = usage.prompt_tokens if usage else count_tokens(prompt)
+        print(f"Summary {variant_label}: {prompt_tokens} input tokens, {time.time() - started:.2f}s")
         summary = response.choices[0].message.content.strip()
         return summary
     except OpenAIError as e:
         print(f"OpenAI API Error in generate_solution_summary: {e}")
-        return "Error generating solution summary."
+        return SUMMARY_ERROR_TEXT
 
 def generate_solution_summaries(raw_solution):
     """
     Generate 3 solution summaries (variants) from the raw solution.
+    The scraped page is compacted once (individual solutions, no duplicates or
+    boilerplate, within a token budget) and reused for every variant.
     Returns a list of summaries.
     """
     summaries = []
     variants = ["Variant 1", "Variant 2", "Variant 3"]
+    compact_solution = prepare_solution_prompt(raw_solution)
+    print(f"Solution prompt compacted from {count_tokens(raw_solution)} to {count_tokens(compact_solution)} tokens.")
     for variant in variants:
-        summary = generate_solution_summary(raw_solution, variant)
+        summary = generate_solution_summary(compact_solution, variant)
         summaries.append(summary)
     return summaries
 
@@ -95,7 +477,7 @@ def generate_followup_question(problem_text, difficulty):
         "Follow-up Problem:"
     )
     try:
-        response = client.chat.completions.create(
+        response = get_openai_client().chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": "You are an expert AMC 10 math tutor who creates clear, detailed problems."},
@@ -108,7 +490,7 @@ def generate_followup_question(problem_text, difficulty):
         return followup_question
     except OpenAIError as e:
         print(f"OpenAI API Error in generate_followup_question: {e}")
-        return "Error generating follow-up question."
+        return FOLLOWUP_ERROR_TEXT
 
 def generate_followup_questions(problem_text):
     """
@@ -122,10 +504,23 @@ def generate_followup_questions(problem_text):
         questions[diff] = question
     return questions
 
+def ensure_adaptive_indexes():
+    """
+    One adaptive document per problem, so concurrent workers upsert instead of duplicating.
+    Fails (and is reported) if the collection already holds duplicates.
+    """
+    try:
+        adaptive_collection.create_index(
+            [("year", ASCENDING), ("contest", ASCENDING), ("problem_number", ASCENDING)], unique=True
+        )
+    except PyMongoError as e:
+        print(f"Error creating unique adaptive index (remove duplicate documents first): {e}")
+
 def save_adaptive_data(problem_metadata, solution_summaries, followup_questions):
     """
     Save the pre-generated adaptive data (solution summaries and follow-up questions)
-    into the adaptive_learning collection.
+    into the adaptive_learning collection. Upserts on (year, contest, problem_number) so a
+    problem generated twice keeps a single document.
     """
     adaptive_doc = {
         "year": problem_metadata.get("year"),
@@ -135,18 +530,30 @@ def save_adaptive_data(problem_metadata, solution_summaries, followup_questions)
         "solution_summaries": solution_summaries,
         "followup_questions": followup_questions
     }
-    result = adaptive_collection.insert_one(adaptive_doc)
-    print(f"Adaptive data saved with ID: {result.inserted_id}")
-    return str(result.inserted_id)
+    saved = adaptive_collection.find_one_and_replace(
+        {
+            "year": adaptive_doc["year"],
+            "contest": adaptive_doc["contest"],
+            "problem_number": adaptive_doc["problem_number"]
+        },
+        adaptive_doc,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    publish_invalidation(db, adaptive_collection.name, adaptive_doc)
+    print(f"Adaptive data saved with ID: {saved['_id']}")
+    return str(saved["_id"])
 
-def pre_generate_adaptive_data(problem_metadata):
+def pre_generate_adaptive_data(problem_metadata, raise_on_error=False):
     """
     Given a problem's metadata (including problem_text), pre-generate adaptive learning data.
     Steps:
       1. Fetch the raw solution from the 'solutions' collection using metadata (year, contest, problem_number).
       2. Generate 3 concise solution summaries from the raw solution.
       3. Generate 3 follow-up questions (for easy, medium, and hard difficulty) from the problem text.
-      4. Save both in the 'adaptive_learning' collection.
+      4. Save both in the adaptive collection (ADAPTIVE_COLLECTION_NAME).
+    If raise_on_error is True, a failed OpenAI call raises AdaptiveGenerationError instead of
+    saving the error placeholders, so the job queue can retry the problem.
     Returns the adaptive document ID.
     """
     query = {
@@ -162,7 +569,11 @@ def pre_generate_adaptive_data(problem_metadata):
 
     solution_summaries = generate_solution_summaries(raw_solution)
     followup_questions = generate_followup_questions(problem_metadata.get("problem_text", ""))
-    
+    if raise_on_error:
+        failed = solution_summaries.count(SUMMARY_ERROR_TEXT) + list(followup_questions.values()).count(FOLLOWUP_ERROR_TEXT)
+        if failed:
+            raise AdaptiveGenerationError(f"{failed} of 6 OpenAI calls failed.")
+
     adaptive_id = save_adaptive_data(problem_metadata, solution_summaries, followup_questions)
     return adaptive_id
 
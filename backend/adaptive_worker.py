@@ -0,0 +1,138 @@
+import sys
+import time
+import threading
+from adaptive_learning import (
+    FOLLOWUP_ERROR_TEXT,
+    SUMMARY_ERROR_TEXT,
+    adaptive_collection,
+    ensure_adaptive_indexes,
+    pre_generate_adaptive_data
+)
+from job_queue import (
+    HEARTBEAT_SECONDS,
+    MAX_ATTEMPTS,
+    claim_job,
+    complete_job,
+    default_worker_id,
+    enqueue_adaptive_for_all,
+    ensure_indexes,
+    fail_job,
+    heartbeat,
+    queue_counts
+)
+
+# How long an idle worker waits before polling the queue again.
+IDLE_SLEEP_SECONDS = 5
+
+class HeartbeatThread(threading.Thread):
+    """
+    Keeps the lease on a job alive while the worker is busy generating.
+    """
+    def __init__(self, job_id, worker_id):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.stop_event = threading.Event()
+        self.lease_lost = False
+
+    def run(self):
+        while not self.stop_event.wait(HEARTBEAT_SECONDS):
+            if not heartbeat(self.job_id, self.worker_id):
+                print(f"Lost lease on job {self.job_id}.")
+                self.lease_lost = True
+                return
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+def has_error_placeholders(adaptive_doc):
+    return (SUMMARY_ERROR_TEXT in adaptive_doc.get("solution_summaries", [])
+            or FOLLOWUP_ERROR_TEXT in adaptive_doc.get("followup_questions", {}).values())
+
+def process_job(job, worker_id):
+    """
+    Run pre_generate_adaptive_data for one claimed job.
+    Skips generation if complete adaptive data already exists (e.g. a previous attempt
+    finished generating but crashed before marking the job done). Documents holding error
+    placeholders from an earlier failed run are regenerated.
+    """
+    metadata = job["payload"]
+    if job.get("attempts", 0) > MAX_ATTEMPTS:
+        # Reclaimed after too many crashed attempts.
+        fail_job(job, worker_id, "Exceeded maximum attempts.")
+        print(f"Dead-lettered job {job['job_key']} after {job['attempts'] - 1} attempts.")
+        return
+
+    existing = adaptive_collection.find_one({
+        "year": metadata["year"],
+        "contest": metadata["contest"],
+        "problem_number": metadata["problem_number"]
+    })
+    if existing and not has_error_placeholders(existing):
+        complete_job(job["_id"], worker_id)
+        print(f"Adaptive data already exists for job {job['job_key']}. Skipping.")
+        return
+
+    beat = HeartbeatThread(job["_id"], worker_id)
+    beat.start()
+    try:
+        adaptive_id = pre_generate_adaptive_data(metadata, raise_on_error=True)
+    except Exception as e:
+        beat.stop()
+        status = fail_job(job, worker_id, e)
+        print(f"Job {job['job_key']} failed (attempt {job['attempts']}): {e}. Now {status}.")
+        return
+    beat.stop()
+
+    if beat.lease_lost:
+        # The save upserted, so the new owner overwrites this result rather than duplicating it.
+        print(f"Job {job['job_key']} finished after its lease was lost; status left to the new owner.")
+    elif complete_job(job["_id"], worker_id):
+        print(f"Completed job {job['job_key']} with adaptive ID: {adaptive_id}")
+    else:
+        print(f"Job {job['job_key']} could not be marked done; its lease expired.")
+
+def run_worker(worker_id=None, exit_when_empty=False):
+    """
+    Claim and process jobs until interrupted.
+    If exit_when_empty is True, stop as soon as the queue has no available jobs.
+    """
+    worker_id = worker_id or default_worker_id()
+    print(f"Worker {worker_id} started.")
+    processed = 0
+    while True:
+        job = claim_job(worker_id)
+        if job is None:
+            if exit_when_empty:
+                break
+            time.sleep(IDLE_SLEEP_SECONDS)
+            continue
+        process_job(job, worker_id)
+        processed += 1
+    print(f"Worker {worker_id} processed {processed} jobs.")
+    return processed
+
+# For direct running:
+#   python adaptive_worker.py enqueue   -> enqueue every problem in db['solutions']
+#   python adaptive_worker.py work      -> run a worker (start one per process/machine)
+#   python adaptive_worker.py drain     -> run a worker until the queue is empty
+#   python adaptive_worker.py status    -> print job counts by state
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "work"
+    ensure_indexes()
+    ensure_adaptive_indexes()
+    if command == "enqueue":
+        enqueue_adaptive_for_all()
+    elif command == "work":
+        try:
+            run_worker()
+        except KeyboardInterrupt:
+            print("Worker shut down.")
+    elif command == "drain":
+        run_worker(exit_when_empty=True)
+    elif command == "status":
+        print(queue_counts())
+    else:
+        print(f"Unknown command: {command}")
+        sys.exit(1)
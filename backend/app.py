@@ -1,7 +1,15 @@
 import os
+import time
+import threading
 from flask import Flask, jsonify, request
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 from flask_cors import CORS
+from grading import AnswerKeyNotFoundError, build_answer_table, grade_submission, lookup_answer, parse_choice, refresh_contest_answers
+from mock_exam import MockExamEngine, TTLStore
+from cache_coherence import CacheInvalidator
+from problem_stats import get_problem_stats, get_student_stats, problem_stats_id, record_attempt
+from adaptive_learning import ADAPTIVE_COLLECTION_NAME, ReviewScheduleCache
 
 # Load environment variables (make sure OPENAI_API_KEY is set in your environment or .env file)
 # (The adaptive learning generation is handled separately.)
@@ -13,7 +21,73 @@ client = MongoClient("mongodb://localhost:27017")
 db = client['amc10_test']
 problems_collection = db['problems']
 answer_keys_collection = db['answer_keys']
-adaptive_collection = db['adaptive_learning_o3']
+adaptive_collection = db[ADAPTIVE_COLLECTION_NAME]
+
+# Normalized answers keyed by (year, contest, problem_number), loaded once at startup and
+# kept current by the invalidator below. As a backstop for missed invalidations, the whole
+# table is rebuilt every ANSWER_TABLE_TTL_SECONDS.
+ANSWER_TABLE_TTL_SECONDS = 30 * 60
+answer_table = build_answer_table(answer_keys_collection)
+# Serializes rebuilds and per-contest refreshes so a slow rebuild cannot swap out a newer refresh.
+answer_table_lock = threading.Lock()
+
+def rebuild_answer_table():
+    global answer_table
+    with answer_table_lock:
+        answer_table = build_answer_table(answer_keys_collection)
+    return answer_table
+
+def rebuild_answer_table_periodically():
+    while True:
+        time.sleep(ANSWER_TABLE_TTL_SECONDS)
+        try:
+            rebuild_answer_table()
+            mock_exam_engine.contests.clear()
+        except PyMongoError as e:
+            print(f"Error rebuilding the answer table: {e}")
+
+# Timed mock-exam sessions, served from memory after the contest is loaded once.
+mock_exam_engine = MockExamEngine(problems_collection, adaptive_collection, lambda: answer_table)
+
+# Adaptive documents keyed by (year, contest, problem_number). The TTL is only a safety
+# net; the invalidator below evicts entries as soon as the generator rewrites them.
+ADAPTIVE_CACHE_TTL_SECONDS = 10 * 60
+adaptive_cache = TTLStore(ADAPTIVE_CACHE_TTL_SECONDS)
+
+# Recently active students' review schedules, checked against the stored version per request.
+review_cache = ReviewScheduleCache()
+
+###############################################
+# Cross-Worker Cache Invalidation
+###############################################
+def on_answer_keys_changed(key):
+    if key and key.get("year") and key.get("contest"):
+        with answer_table_lock:
+            refresh_contest_answers(answer_table, answer_keys_collection, key["year"], key["contest"])
+        mock_exam_engine.contests.delete((key["year"], key["contest"]))
+    else:
+        rebuild_answer_table()
+        mock_exam_engine.contests.clear()
+
+def on_contest_data_changed(key):
+    if key and key.get("year") and key.get("contest"):
+        mock_exam_engine.contests.delete((key["year"], key["contest"]))
+    else:
+        mock_exam_engine.contests.clear()
+
+def on_adaptive_changed(key):
+    on_contest_data_changed(key)
+    if key and all(key.get(field) for field in ("year", "contest", "problem_number")):
+        adaptive_cache.delete((key["year"], key["contest"], key["problem_number"]))
+    else:
+        adaptive_cache.clear()
+
+cache_invalidator = CacheInvalidator(db)
+cache_invalidator.register(answer_keys_collection.name, on_answer_keys_changed)
+cache_invalidator.register(problems_collection.name, on_contest_data_changed)
+cache_invalidator.register(adaptive_collection.name, on_adaptive_changed)
+cache_invalidator.start()
+threading.Thread(target=rebuild_answer_table_periodically, daemon=True).start()
 
 ###############################################
 # Endpoint: Return a Random Problem
@@ -27,18 +101,12 @@ def show_problem():
 
     problem['_id'] = str(problem['_id'])
     
-    # Attach the answer key from the answer_keys_collection (if available)
-    answer_keys_doc = answer_keys_collection.find_one({})
-    if answer_keys_doc:
-        answer_keys_doc['_id'] = str(answer_keys_doc['_id'])
-        answers = answer_keys_doc.get("answers", {})
-        problem_number = problem.get("problem_number", None)
-        if problem_number:
-            key = f"Problem {problem_number}"
-            answer_key = answers.get(key, None)
-            problem["answer_key"] = answer_key
-        else:
-            problem["answer_key"] = None
+    # Attach the answer key from the in-memory answer table (if available)
+    problem_number = problem.get("problem_number", None)
+    if problem_number:
+        problem["answer_key"] = lookup_answer(
+            answer_table, problem.get("year", ""), problem.get("contest", ""), problem_number
+        )
     else:
         problem["answer_key"] = None
 
@@ -62,7 +130,13 @@ def get_adaptive_learning():
         "contest": contest,
         "problem_number": problem_number
     }
-    adaptive_doc = adaptive_collection.find_one(query)
+    cache_key = (year, contest, problem_number)
+    adaptive_doc = adaptive_cache.get(cache_key)
+    if adaptive_doc is None:
+        adaptive_doc = adaptive_collection.find_one(query)
+        if adaptive_doc:
+            adaptive_doc["_id"] = str(adaptive_doc["_id"])
+            adaptive_cache.set(cache_key, adaptive_doc)
     if not adaptive_doc:
         return jsonify({
             "error": "Adaptive data not found.",
@@ -70,7 +144,6 @@ def get_adaptive_learning():
             "message": "Please ensure that adaptive learning data has been generated for this problem."
         }), 404
 
-    adaptive_doc["_id"] = str(adaptive_doc["_id"])
     solution_summaries = adaptive_doc.get("solution_summaries", [])
     solution_summary = solution_summaries[0] if solution_summaries else "No solution available."
     followup_questions = adaptive_doc.get("followup_questions", {})
@@ -83,6 +156,228 @@ def get_adaptive_learning():
     }
     return jsonify(response_data)
 
+###############################################
+# Endpoint: Grade One or Many Submissions
+###############################################
+@app.route("/grade", methods=["POST"])
+def grade():
+    """
+    Grade submissions against the in-memory answer table.
+    Body is either a single submission {"year", "contest", "answers"} or
+    {"submissions": [submission, ...]}. "answers" is a list of 25 letters or a map
+    keyed by problem number. Answers must be A-E or empty; anything else is rejected.
+    A contest without an answer key is a 404 (or a per-submission error in a batch).
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+
+    submissions = body.get("submissions")
+    single = submissions is None
+    if single:
+        submissions = [body]
+    if not isinstance(submissions, list):
+        return jsonify({"error": "submissions must be a list."}), 400
+
+    graded = []
+    for submission in submissions:
+        try:
+            graded.append(grade_submission(answer_table, submission))
+        except AnswerKeyNotFoundError as e:
+            if single:
+                return jsonify({"error": str(e)}), 404
+            graded.append({"error": str(e)})
+        except (AttributeError, ValueError) as e:
+            if single:
+                return jsonify({"error": str(e)}), 400
+            graded.append({"error": str(e)})
+
+    return jsonify(graded[0] if single else {"results": graded})
+
+###############################################
+# Endpoint: Reload the Answer Table
+###############################################
+@app.route("/grade/reload", methods=["POST"])
+def reload_answer_table():
+    """
+    Rebuild the answer table after new answer keys are scraped.
+    """
+    table = rebuild_answer_table()
+    mock_exam_engine.contests.clear()
+    return jsonify({"answers_loaded": len(table)})
+
+###############################################
+# Endpoints: Timed Mock-Exam Sessions
+###############################################
+# Sessions are held in the worker process that started them; when running several
+# processes behind a load balancer, enable sticky sessions for /mock_exam routes.
+@app.route("/mock_exam", methods=["POST"])
+def start_mock_exam():
+    """
+    Start a session for {"year", "contest"}, or a random full contest if omitted.
+    Returns the session state and the first problem.
+    """
+    body = request.get_json(silent=True) or {}
+    year = body.get("year")
+    contest = body.get("contest")
+    if not (year and contest):
+        picked = mock_exam_engine.random_contest()
+        if not picked:
+            return jsonify({"error": "No complete contests found"}), 404
+        year, contest = picked
+
+    session = mock_exam_engine.start_session(str(year), contest)
+    if not session:
+        return jsonify({"error": "Contest not found.", "year": year, "contest": contest}), 404
+    return jsonify({
+        "session": mock_exam_engine.session_state(session),
+        "problem": mock_exam_engine.navigate(session, step=0)
+    })
+
+@app.route("/mock_exam/<session_id>", methods=["GET"])
+def get_mock_exam(session_id):
+    session = mock_exam_engine.get_session(session_id)
+    if not session:
+        return jsonify({"error": "Session not found or expired."}), 404
+    return jsonify(mock_exam_engine.session_state(session))
+
+@app.route("/mock_exam/<session_id>/problem", methods=["GET"])
+def navigate_mock_exam(session_id):
+    """
+    Navigate with ?problem_number=N, or ?step=1 / ?step=-1 for next/previous.
+    """
+    session = mock_exam_engine.get_session(session_id)
+    if not session:
+        return jsonify({"error": "Session not found or expired."}), 404
+    try:
+        problem_number = request.args.get("problem_number", type=int)
+        step = request.args.get("step", 0, type=int)
+        problem = mock_exam_engine.navigate(session, problem_number=problem_number, step=step)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "problem": problem,
+        "time_remaining": mock_exam_engine.time_remaining(session)
+    })
+
+@app.route("/mock_exam/<session_id>/answer", methods=["POST"])
+def answer_mock_exam(session_id):
+    """
+    Record {"problem_number", "answer"}; an empty answer clears it.
+    """
+    session = mock_exam_engine.get_session(session_id)
+    if not session:
+        return jsonify({"error": "Session not found or expired."}), 404
+    body = request.get_json(silent=True) or {}
+    try:
+        mock_exam_engine.record_answer(session, int(body.get("problem_number")), body.get("answer"))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(mock_exam_engine.session_state(session))
+
+@app.route("/mock_exam/<session_id>/submit", methods=["POST"])
+def submit_mock_exam(session_id):
+    session = mock_exam_engine.get_session(session_id)
+    if not session:
+        return jsonify({"error": "Session not found or expired."}), 404
+    try:
+        return jsonify(mock_exam_engine.submit(session))
+    except AnswerKeyNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+
+###############################################
+# Endpoint: Record an Attempt
+###############################################
+@app.route("/attempts", methods=["POST"])
+def post_attempt():
+    """
+    Record {"student_id", "year", "contest", "problem_number", "answer", "time_seconds"}.
+    Correctness is checked against the answer table and folded into the stats.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Request body must be a JSON object."}), 400
+    student_id = body.get("student_id")
+    year = body.get("year")
+    contest = body.get("contest")
+    problem_number = body.get("problem_number")
+    if not (student_id and year and contest and problem_number):
+        return jsonify({"error": "Missing required parameters."}), 400
+    # student_id is used as a document _id; anything but a string could act as a query operator.
+    if not isinstance(student_id, str) or not isinstance(contest, str):
+        return jsonify({"error": "student_id and contest must be strings."}), 400
+
+    correct_answer = lookup_answer(answer_table, year, contest, problem_number)
+    if correct_answer is None:
+        return jsonify({"error": "Answer key not found."}), 404
+    try:
+        given = parse_choice(body.get("answer"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    is_correct = given == correct_answer
+    try:
+        record_attempt(student_id, year, contest, problem_number, given, is_correct, body.get("time_seconds", 0))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Cards are saved one by one, so several app processes can update the same student
+    # without overwriting each other.
+    card_key = problem_stats_id(year, contest, problem_number)
+    next_review = review_cache.review(student_id, card_key, is_correct)
+    return jsonify({"is_correct": is_correct, "correct_answer": correct_answer, "next_review_at": next_review})
+
+###############################################
+# Endpoint: Next Due Review for a Student
+###############################################
+@app.route("/reviews/next", methods=["GET"])
+def next_review():
+    """
+    Return the earliest due review for ?student_id=, as a problem document.
+    """
+    student_id = request.args.get("student_id")
+    if not student_id:
+        return jsonify({"error": "Missing required parameters."}), 400
+    card_key = review_cache.next_due(student_id)
+    if card_key is None:
+        return jsonify({"error": "No reviews due."}), 404
+
+    year, contest, problem_number = card_key.split("|")
+    problem = problems_collection.find_one({"year": year, "contest": contest, "problem_number": problem_number})
+    if not problem:
+        return jsonify({"error": "Problem not found.", "review": card_key}), 404
+    problem["_id"] = str(problem["_id"])
+    problem["answer_key"] = lookup_answer(answer_table, year, contest, problem_number)
+    return jsonify(problem)
+
+###############################################
+# Endpoint: Get Problem or Student Statistics
+###############################################
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    """
+    ?year=&contest=&problem_number= returns problem stats; ?student_id= returns student stats.
+    Both are single lookups on materialized documents.
+    """
+    student_id = request.args.get("student_id")
+    if student_id:
+        stats = get_student_stats(student_id)
+    else:
+        year = request.args.get("year")
+        contest = request.args.get("contest")
+        problem_number = request.args.get("problem_number")
+        if not (year and contest and problem_number):
+            return jsonify({"error": "Missing required parameters."}), 400
+        try:
+            stats = get_problem_stats(year, contest, problem_number)
+        except ValueError:
+            return jsonify({"error": "problem_number must be an integer."}), 400
+    if not stats:
+        return jsonify({"error": "No statistics found."}), 404
+    stats["updated_at"] = stats["updated_at"].isoformat() if stats.get("updated_at") else None
+    if stats.get("last_attempt_at"):
+        stats["last_attempt_at"] = stats["last_attempt_at"].isoformat()
+    return jsonify(stats)
+
 
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
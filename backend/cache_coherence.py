@@ -0,0 +1,214 @@
+import time
+import threading
+from datetime import datetime
+from pymongo import ReturnDocument, ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Fallback polling interval, and the bound on how stale a worker's cache can get while
+# polling. Change streams deliver invalidations almost immediately.
+POLL_INTERVAL_SECONDS = 2
+# While polling, how often to try change streams again (e.g. after a replica set election
+# or once a standalone server is converted to a replica set).
+CHANGE_STREAM_RETRY_SECONDS = 5 * 60
+# Invalidation log entries are kept this long for polling workers to catch up.
+INVALIDATION_LOG_TTL_SECONDS = 24 * 60 * 60
+# Fields that identify a cached document; a key holds whichever of these the document has.
+KEY_FIELDS = ("year", "contest", "problem_number")
+
+# Server error codes: change streams need a replica set; the resume point has rolled off the oplog.
+CHANGE_STREAMS_UNSUPPORTED = 40573
+CHANGE_STREAM_HISTORY_LOST = 286
+
+VERSIONS_COLLECTION = "cache_versions"
+INVALIDATIONS_COLLECTION = "cache_invalidations"
+
+def cache_key(doc):
+    """
+    Extract the cache key fields from a document, e.g.
+    {"year": "2024", "contest": "AMC 10A", "problem_number": "7"}.
+    """
+    return {field: doc[field] for field in KEY_FIELDS if doc.get(field) is not None}
+
+def ensure_invalidation_indexes(db):
+    db[INVALIDATIONS_COLLECTION].create_index([("collection", ASCENDING), ("version", ASCENDING)])
+    db[INVALIDATIONS_COLLECTION].create_index("created_at", expireAfterSeconds=INVALIDATION_LOG_TTL_SECONDS)
+
+def publish_invalidation(db, collection_name, doc):
+    """
+    Record that a document in collection_name changed, for workers that cannot use
+    change streams. Bumps the collection's version document, then logs the key under
+    that version. Writers (scraper, adaptive generator) call this after each write.
+    """
+    try:
+        version = db[VERSIONS_COLLECTION].find_one_and_update(
+            {"_id": collection_name},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )["version"]
+        db[INVALIDATIONS_COLLECTION].insert_one({
+            "collection": collection_name,
+            "version": version,
+            "key": cache_key(doc),
+            "created_at": datetime.utcnow()
+        })
+    except PyMongoError as e:
+        # Workers still converge through their cache TTLs.
+        print(f"Error publishing cache invalidation for {collection_name}: {e}")
+
+class CacheInvalidator:
+    """
+    Keeps one worker's in-process caches coherent with MongoDB.
+    Handlers are registered per collection and called with the changed document's key
+    (see cache_key), or with None when the affected key is unknown (e.g. a delete) and
+    everything cached from that collection should be dropped.
+
+    A background thread tails a change stream on the watched collections. If the server
+    does not support change streams (standalone mongod), it falls back to polling the
+    version documents written by publish_invalidation, and retries change streams every
+    retry_interval seconds. Every fallback and every broken stream flushes all caches,
+    since changes may have been missed in between. For a local replica-set stand-in,
+    run a single-node replica set: mongod --replSet rs0, then rs.initiate().
+    """
+    def __init__(self, db, poll_interval=POLL_INTERVAL_SECONDS, retry_interval=CHANGE_STREAM_RETRY_SECONDS):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.handlers = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.mode = None
+        self.resume_token = None
+        self.seen_versions = {}
+
+    def register(self, collection_name, handler):
+        self.handlers.setdefault(collection_name, []).append(handler)
+
+    def dispatch(self, collection_name, key):
+        for handler in self.handlers.get(collection_name, []):
+            try:
+                handler(key)
+            except Exception as e:
+                print(f"Error in cache handler for {collection_name}: {e}")
+
+    def flush_all(self):
+        for collection_name in self.handlers:
+            self.dispatch(collection_name, None)
+
+    def start(self):
+        """Start the background watcher thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.poll_interval + 1)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.watch_change_stream()
+            except NotImplementedError as e:
+                self.fall_back_to_polling(e)
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    self.fall_back_to_polling(e)
+                    continue
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # The resume point is gone; start a fresh stream.
+                    self.resume_token = None
+                self.reconnect(e)
+            except PyMongoError as e:
+                self.reconnect(e)
+
+    def reconnect(self, error):
+        # Lost the stream; anything may have changed in between.
+        print(f"Change stream interrupted: {error}. Reconnecting.")
+        self.flush_all()
+        self.stop_event.wait(self.poll_interval)
+
+    def fall_back_to_polling(self, error):
+        if self.mode != "polling":
+            print(f"Change streams unavailable ({error}); polling for cache invalidations.")
+        try:
+            self.poll_versions()
+        except PyMongoError as e:
+            self.reconnect(e)
+
+    def watch_change_stream(self):
+        """
+        Tail a change stream over the watched collections and dispatch each change.
+        Resumes from the last seen event after a reconnect.
+        """
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.handlers)}}}]
+        with self.db.watch(pipeline, full_document="updateLookup", resume_after=self.resume_token) as stream:
+            if self.mode == "polling":
+                # Pick up anything published between the last poll and opening the stream.
+                self.poll_once()
+            self.mode = "change_stream"
+            while not self.stop_event.is_set():
+                change = stream.try_next()
+                if change is None:
+                    # try_next returns after the server's await time with no events.
+                    continue
+                self.resume_token = stream.resume_token
+                collection_name = change.get("ns", {}).get("coll")
+                if change["operationType"] == "invalidate":
+                    # The stream is closed and cannot be resumed past this event.
+                    self.resume_token = None
+                    self.flush_all()
+                    return
+                if change["operationType"] in ("drop", "rename"):
+                    self.dispatch(collection_name, None)
+                    continue
+                full_document = change.get("fullDocument")
+                self.dispatch(collection_name, cache_key(full_document) if full_document else None)
+
+    def current_versions(self):
+        docs = self.db[VERSIONS_COLLECTION].find({"_id": {"$in": list(self.handlers)}})
+        return {doc["_id"]: doc.get("version", 0) for doc in docs}
+
+    def poll_versions(self):
+        """
+        Poll the version documents until stopped or retry_interval has passed. When a
+        collection's version moves, replay the logged keys since the last seen version;
+        if any are missing (log expired, or a writer is between the two writes), flush
+        that collection.
+        On switching to polling, the starting versions are recorded and then all caches
+        are flushed, so nothing changed before polling began is missed. A retry that
+        stays in polling keeps its versions and caches.
+        """
+        if self.mode != "polling":
+            try:
+                ensure_invalidation_indexes(self.db)
+            except PyMongoError as e:
+                print(f"Error creating cache invalidation indexes: {e}")
+            self.seen_versions = self.current_versions()
+            self.mode = "polling"
+            self.flush_all()
+        deadline = time.monotonic() + self.retry_interval
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except PyMongoError as e:
+                print(f"Error polling cache versions: {e}")
+            if time.monotonic() >= deadline:
+                return
+
+    def poll_once(self):
+        for collection_name, version in self.current_versions().items():
+            seen = self.seen_versions.get(collection_name, 0)
+            if version <= seen:
+                continue
+            entries = list(self.db[INVALIDATIONS_COLLECTION].find(
+                {"collection": collection_name, "version": {"$gt": seen, "$lte": version}}
+            ).sort("version", ASCENDING))
+            if len(entries) < version - seen:
+                self.dispatch(collection_name, None)
+            else:
+                for entry in entries:
+                    self.dispatch(collection_name, entry.get("key") or None)
+            self.seen_versions[collection_name] = version
@@ -0,0 +1,171 @@
+import re
+
+# AMC 10/12 scoring: 6 points per correct answer, 1.5 per blank, 0 per wrong answer.
+POINTS_CORRECT = 6.0
+POINTS_BLANK = 1.5
+POINTS_WRONG = 0.0
+NUM_PROBLEMS = 25
+
+CHOICE_PATTERN = re.compile(r"\b([A-E])\b")
+
+class AnswerKeyNotFoundError(LookupError):
+    """Raised when a contest has no answers in the answer table."""
+
+def normalize_choice(answer):
+    """
+    Reduce an answer to a single letter A-E, or None if blank/unrecognized.
+    Accepts forms like "B", "b", "(B)", "B.", "\\textbf{(B)}".
+    """
+    if answer is None:
+        return None
+    text = str(answer).strip().upper()
+    if not text:
+        return None
+    if len(text) == 1:
+        return text if text in "ABCDE" else None
+    match = CHOICE_PATTERN.search(text.replace("TEXTBF", " "))
+    return match.group(1) if match else None
+
+def parse_choice(answer):
+    """
+    Normalize a student's answer. Returns a letter A-E, or None if the answer is missing
+    or empty. Anything else (e.g. "F" or "7") raises ValueError, so it is never scored
+    as a blank.
+    """
+    if answer is None or not str(answer).strip():
+        return None
+    choice = normalize_choice(answer)
+    if choice is None:
+        raise ValueError(f"Invalid answer {answer!r}; expected a letter A-E or an empty answer.")
+    return choice
+
+def make_problem_key(year, contest, problem_number):
+    """
+    Normalized lookup key, e.g. ("2024", "AMC 10A", 7).
+    """
+    return (str(year).strip(), str(contest).strip(), int(problem_number))
+
+def add_answer_key_doc(table, doc):
+    """
+    Add one answer_keys document's answers to the table.
+    """
+    year = doc.get("year")
+    contest = doc.get("contest")
+    if not (year and contest):
+        return
+    for label, answer in doc.get("answers", {}).items():
+        match = re.search(r"(\d+)", label)
+        if not match:
+            continue
+        table[make_problem_key(year, contest, match.group(1))] = normalize_choice(answer)
+
+def build_answer_table(answer_keys_collection):
+    """
+    Load every answer_keys document into a flat dict keyed by
+    (year, contest, problem_number) with normalized letter answers.
+    Built once at startup so grading never touches the database.
+    """
+    table = {}
+    for doc in answer_keys_collection.find({}, {"year": 1, "contest": 1, "answers": 1}):
+        add_answer_key_doc(table, doc)
+    print(f"Loaded {len(table)} answers into the answer table.")
+    return table
+
+def refresh_contest_answers(table, answer_keys_collection, year, contest):
+    """
+    Reload one contest's answers in place after its answer key document changed.
+    The new answers are loaded first and written over the old ones, and only keys that
+    disappeared are deleted, so concurrent readers never see a current answer missing.
+    """
+    year, contest = str(year).strip(), str(contest).strip()
+    fresh = {}
+    for doc in answer_keys_collection.find({"year": year, "contest": contest}, {"year": 1, "contest": 1, "answers": 1}):
+        add_answer_key_doc(fresh, doc)
+    table.update(fresh)
+    for key in [key for key in table if key[0] == year and key[1] == contest and key not in fresh]:
+        del table[key]
+
+def lookup_answer(answer_table, year, contest, problem_number):
+    """
+    Return the normalized answer for a problem, or None if unknown.
+    """
+    try:
+        return answer_table.get(make_problem_key(year, contest, problem_number))
+    except (TypeError, ValueError):
+        return None
+
+def submission_answers(answers):
+    """
+    Turn a submission's answers into {problem_number: raw_answer}.
+    Accepts either a list of 25 answers (index 0 is Problem 1) or a mapping keyed by
+    "7", 7 or "Problem 7".
+    """
+    if isinstance(answers, list):
+        return {number: answer for number, answer in enumerate(answers, start=1)}
+    if isinstance(answers, dict):
+        result = {}
+        for label, answer in answers.items():
+            match = re.search(r"(\d+)", str(label))
+            if match:
+                result[int(match.group(1))] = answer
+        return result
+    raise ValueError("answers must be a list or an object.")
+
+def grade_submission(answer_table, submission):
+    """
+    Grade one submission of the form {"year", "contest", "answers"}.
+    Returns per-problem results plus AMC-style totals.
+    Raises ValueError for a malformed submission or an invalid answer, and
+    AnswerKeyNotFoundError if the answer table has no answers for the contest.
+    """
+    year = submission.get("year")
+    contest = submission.get("contest")
+    if not (year and contest):
+        raise ValueError("Submission is missing year or contest.")
+    answers = submission_answers(submission.get("answers", {}))
+    given_answers = {}
+    for number in range(1, NUM_PROBLEMS + 1):
+        try:
+            given_answers[number] = parse_choice(answers.get(number))
+        except ValueError as e:
+            raise ValueError(f"Problem {number}: {e}")
+    expected_answers = {number: lookup_answer(answer_table, year, contest, number) for number in range(1, NUM_PROBLEMS + 1)}
+    if all(expected is None for expected in expected_answers.values()):
+        raise AnswerKeyNotFoundError(f"No answer key found for {year} {contest}.")
+
+    results = []
+    correct = blank = wrong = ungraded = 0
+    for number in range(1, NUM_PROBLEMS + 1):
+        given = given_answers[number]
+        expected = expected_answers[number]
+        if expected is None:
+            status = "ungraded"
+            ungraded += 1
+        elif given is None:
+            status = "blank"
+            blank += 1
+        elif given == expected:
+            status = "correct"
+            correct += 1
+        else:
+            status = "wrong"
+            wrong += 1
+        results.append({
+            "problem_number": number,
+            "answer": given,
+            "correct_answer": expected,
+            "status": status,
+            "is_correct": status == "correct"
+        })
+
+    return {
+        "year": str(year),
+        "contest": contest,
+        "results": results,
+        "correct": correct,
+        "wrong": wrong,
+        "blank": blank,
+        "ungraded": ungraded,
+        "score": correct * POINTS_CORRECT + blank * POINTS_BLANK + wrong * POINTS_WRONG,
+        "max_score": NUM_PROBLEMS * POINTS_CORRECT
+    }
@@ -0,0 +1,189 @@
+import socket
+import os
+from datetime import datetime, timedelta
+from pymongo import MongoClient, ReturnDocument, ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+# Connect to MongoDB and define collections
+mongo_client = MongoClient("mongodb://localhost:27017")
+db = mongo_client['amc10_test']
+jobs_collection = db['adaptive_jobs']
+raw_solutions_collection = db['solutions']
+
+# A claimed job belongs to its worker until the lease expires. Workers extend the
+# lease with heartbeats; if a worker crashes, the job becomes claimable again.
+LEASE_SECONDS = 300
+HEARTBEAT_SECONDS = 60
+MAX_ATTEMPTS = 3
+
+# Job states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+def ensure_indexes():
+    """
+    Create the indexes the queue relies on.
+    job_key is unique so enqueueing the same problem twice is a no-op.
+    """
+    jobs_collection.create_index("job_key", unique=True)
+    jobs_collection.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    jobs_collection.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+
+def make_job_key(problem_metadata):
+    """
+    Build the dedupe key for a problem, e.g. "2024|AMC 10A|1".
+    """
+    return "|".join(str(problem_metadata.get(field, "")) for field in ("year", "contest", "problem_number"))
+
+def default_worker_id():
+    """
+    Identify this worker by host name and process ID.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def enqueue_job(problem_metadata):
+    """
+    Add a pre_generate_adaptive_data job for the given problem metadata.
+    Returns True if a new job was created, False if one already existed.
+    """
+    now = datetime.utcnow()
+    try:
+        result = jobs_collection.update_one(
+            {"job_key": make_job_key(problem_metadata)},
+            {"$setOnInsert": {
+                "payload": problem_metadata,
+                "status": PENDING,
+                "attempts": 0,
+                "lease_owner": None,
+                "lease_expires_at": None,
+                "last_error": None,
+                "created_at": now,
+                "updated_at": now
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Another process upserted the same key concurrently.
+        return False
+    return result.upserted_id is not None
+
+def enqueue_adaptive_for_all():
+    """
+    Enqueue a job for every problem in the db['solutions'] collection.
+    Uses the same metadata and skip rules as generate_adaptive_for_all.
+    """
+    ensure_indexes()
+    count = 0
+    for sol in raw_solutions_collection.find({}):
+        metadata = {
+            "year": sol.get("year", ""),
+            "contest": sol.get("contest", ""),
+            "problem_number": sol.get("problem_number", ""),
+            "problem_text": sol.get("problem_statement", "")
+        }
+        if not (metadata["year"] and metadata["contest"] and metadata["problem_number"] and metadata["problem_text"]):
+            print(f"Skipping solution with missing metadata: {metadata}")
+            continue
+        if enqueue_job(metadata):
+            count += 1
+    print(f"Enqueued {count} new jobs.")
+    return count
+
+def claim_job(worker_id):
+    """
+    Atomically claim the oldest available job.
+    A job is available if it is pending, or if it is running but its lease has expired
+    (the worker that held it crashed or stalled). Returns the job document or None.
+    """
+    now = datetime.utcnow()
+    return jobs_collection.find_one_and_update(
+        {"$or": [
+            {"status": PENDING},
+            {"status": RUNNING, "lease_expires_at": {"$lt": now}}
+        ]},
+        {
+            "$set": {
+                "status": RUNNING,
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS),
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def heartbeat(job_id, worker_id):
+    """
+    Extend the lease on a job this worker holds.
+    Returns False if the lease was lost (the job was reclaimed by another worker).
+    """
+    now = datetime.utcnow()
+    result = jobs_collection.update_one(
+        {"_id": job_id, "status": RUNNING, "lease_owner": worker_id},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=LEASE_SECONDS), "updated_at": now}}
+    )
+    return result.modified_count == 1
+
+def complete_job(job_id, worker_id):
+    """
+    Mark a job as done. Only succeeds if this worker still holds the lease.
+    """
+    result = jobs_collection.update_one(
+        {"_id": job_id, "status": RUNNING, "lease_owner": worker_id},
+        {"$set": {
+            "status": DONE,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "updated_at": datetime.utcnow()
+        }}
+    )
+    return result.modified_count == 1
+
+def fail_job(job, worker_id, error):
+    """
+    Record a failed attempt.
+    The job goes back to pending for a retry, or to the dead-letter state once it has
+    used up MAX_ATTEMPTS.
+    """
+    status = DEAD if job.get("attempts", 0) >= MAX_ATTEMPTS else PENDING
+    result = jobs_collection.update_one(
+        {"_id": job["_id"], "status": RUNNING, "lease_owner": worker_id},
+        {"$set": {
+            "status": status,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "last_error": str(error),
+            "updated_at": datetime.utcnow()
+        }}
+    )
+    return status if result.modified_count == 1 else None
+
+def dead_letter_jobs():
+    """
+    Return all jobs that exhausted their retries.
+    """
+    return list(jobs_collection.find({"status": DEAD}))
+
+def requeue_dead_jobs():
+    """
+    Move dead-lettered jobs back to pending with a fresh attempt count.
+    """
+    result = jobs_collection.update_many(
+        {"status": DEAD},
+        {"$set": {"status": PENDING, "attempts": 0, "updated_at": datetime.utcnow()}}
+    )
+    print(f"Requeued {result.modified_count} dead jobs.")
+    return result.modified_count
+
+def queue_counts():
+    """
+    Return the number of jobs in each state.
+    """
+    counts = {PENDING: 0, RUNNING: 0, DONE: 0, DEAD: 0}
+    for row in jobs_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+        counts[row["_id"]] = row["count"]
+    return counts
@@ -0,0 +1,255 @@
+import time
+import uuid
+import threading
+from grading import NUM_PROBLEMS, grade_submission, lookup_answer, parse_choice
+
+# AMC 10/12 time limit, plus a little slack before an idle session is dropped.
+EXAM_SECONDS = 75 * 60
+SESSION_TTL_SECONDS = EXAM_SECONDS + 15 * 60
+# How long a loaded contest payload is shared before it is re-read from MongoDB.
+CONTEST_TTL_SECONDS = 30 * 60
+
+class TTLStore:
+    """
+    Thread-safe in-process key/value store whose entries expire after ttl seconds.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self.data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.data[key] = (value, time.time() + (ttl if ttl is not None else self.ttl))
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def purge_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [key for key, (_, expires_at) in self.data.items() if expires_at < now]
+            for key in expired:
+                del self.data[key]
+        return len(expired)
+
+class MockExamEngine:
+    """
+    Runs timed mock-exam sessions for a full 25-problem contest.
+    The contest's problems, answer keys and adaptive data are fetched in one batched
+    query when the first session for that contest starts. The payload is then shared by
+    every session of that contest, and all navigation is served from memory.
+
+    Session state lives in this process only. When app.py runs as several processes
+    behind a load balancer, the balancer must use sticky sessions (route every
+    /mock_exam/<session_id> call to the worker that started it); other workers answer 404.
+    Each session carries its own lock, so concurrent requests for one session are serialized.
+    """
+    def __init__(self, problems_collection, adaptive_collection, answer_table_getter):
+        self.problems_collection = problems_collection
+        self.adaptive_collection = adaptive_collection
+        # Callable so the engine always sees the current table after a reload.
+        self.answer_table_getter = answer_table_getter
+        self.contests = TTLStore(CONTEST_TTL_SECONDS)
+        self.sessions = TTLStore(SESSION_TTL_SECONDS)
+        self.load_locks = {}
+        self.load_locks_guard = threading.Lock()
+
+    def load_contest(self, year, contest):
+        """
+        Fetch all problems of a contest joined with their adaptive data in a single
+        aggregation, and attach answers from the in-memory answer table.
+        Returns a list of problems ordered by problem number.
+        """
+        pipeline = [
+            {"$match": {"year": year, "contest": contest}},
+            {"$lookup": {
+                "from": self.adaptive_collection.name,
+                "let": {"year": "$year", "contest": "$contest", "problem_number": "$problem_number"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$eq": ["$year", "$$year"]},
+                        {"$eq": ["$contest", "$$contest"]},
+                        {"$eq": ["$problem_number", "$$problem_number"]}
+                    ]}}},
+                    {"$project": {"_id": 0, "solution_summaries": 1, "followup_questions": 1}},
+                    {"$limit": 1}
+                ],
+                "as": "adaptive"
+            }}
+        ]
+        answer_table = self.answer_table_getter()
+        problems = {}
+        for doc in self.problems_collection.aggregate(pipeline):
+            try:
+                number = int(doc.get("problem_number"))
+            except (TypeError, ValueError):
+                continue
+            if number in problems:
+                # Duplicate scrape of the same problem; keep the first one.
+                continue
+            doc["_id"] = str(doc["_id"])
+            adaptive = doc.pop("adaptive", [])
+            doc["adaptive"] = adaptive[0] if adaptive else None
+            doc["answer_key"] = lookup_answer(answer_table, year, contest, number)
+            problems[number] = doc
+        return [problems[number] for number in sorted(problems)]
+
+    def get_contest(self, year, contest):
+        """
+        Return the shared payload for a contest, loading it at most once even when many
+        sessions start at the same time.
+        """
+        key = (year, contest)
+        payload = self.contests.get(key)
+        if payload is not None:
+            return payload
+        with self.load_locks_guard:
+            lock = self.load_locks.setdefault(key, threading.Lock())
+        with lock:
+            payload = self.contests.get(key)
+            if payload is None:
+                payload = self.load_contest(year, contest)
+                if payload:
+                    self.contests.set(key, payload)
+        return payload
+
+    def start_session(self, year, contest):
+        """
+        Start a new session. Returns the session dict, or None if the contest has no
+        problems in the database.
+        """
+        problems = self.get_contest(year, contest)
+        if not problems:
+            return None
+        now = time.time()
+        session = {
+            "session_id": uuid.uuid4().hex,
+            "year": year,
+            "contest": contest,
+            "problem_numbers": [int(p["problem_number"]) for p in problems],
+            "current": 0,
+            "answers": {},
+            "started_at": now,
+            "ends_at": now + EXAM_SECONDS,
+            "submitted": False,
+            "result": None,
+            "lock": threading.RLock()
+        }
+        self.sessions.set(session["session_id"], session)
+        return session
+
+    def get_session(self, session_id):
+        return self.sessions.get(session_id)
+
+    def time_remaining(self, session):
+        return max(0, int(session["ends_at"] - time.time()))
+
+    def session_state(self, session):
+        """
+        Public view of a session (no answer keys until it is submitted).
+        """
+        with session["lock"]:
+            return {
+                "session_id": session["session_id"],
+                "year": session["year"],
+                "contest": session["contest"],
+                "current": session["problem_numbers"][session["current"]],
+                "problem_numbers": session["problem_numbers"],
+                "answers": dict(session["answers"]),
+                "time_remaining": self.time_remaining(session),
+                "submitted": session["submitted"],
+                "result": session["result"]
+            }
+
+    def problem_view(self, session, problem_number):
+        """
+        Return one problem from the shared payload. Answer keys and adaptive data are
+        only included after the session has been submitted.
+        """
+        problems = self.get_contest(session["year"], session["contest"])
+        for problem in problems or []:
+            if int(problem["problem_number"]) == problem_number:
+                view = {k: v for k, v in problem.items() if k not in ("answer_key", "adaptive")}
+                if session["submitted"]:
+                    view["answer_key"] = problem["answer_key"]
+                    view["adaptive"] = problem["adaptive"]
+                view["selected_answer"] = session["answers"].get(str(problem_number))
+                return view
+        return None
+
+    def navigate(self, session, problem_number=None, step=0):
+        """
+        Move to a specific problem number, or step forward/backward from the current one.
+        Returns the problem now being shown.
+        """
+        numbers = session["problem_numbers"]
+        with session["lock"]:
+            if problem_number is not None:
+                if problem_number not in numbers:
+                    raise ValueError(f"Problem {problem_number} is not part of this exam.")
+                session["current"] = numbers.index(problem_number)
+            else:
+                session["current"] = min(max(session["current"] + step, 0), len(numbers) - 1)
+            return self.problem_view(session, numbers[session["current"]])
+
+    def record_answer(self, session, problem_number, answer):
+        """
+        Store (or clear, if answer is empty) the student's answer for a problem.
+        Raises ValueError for anything other than a letter A-E.
+        """
+        choice = parse_choice(answer)
+        with session["lock"]:
+            if session["submitted"]:
+                raise ValueError("Exam has already been submitted.")
+            if self.time_remaining(session) <= 0:
+                raise ValueError("Time is up; submit the exam.")
+            if problem_number not in session["problem_numbers"]:
+                raise ValueError(f"Problem {problem_number} is not part of this exam.")
+            if choice:
+                session["answers"][str(problem_number)] = choice
+            else:
+                session["answers"].pop(str(problem_number), None)
+
+    def submit(self, session):
+        """
+        Grade the session once and keep the result on the session.
+        """
+        with session["lock"]:
+            if not session["submitted"]:
+                session["result"] = grade_submission(self.answer_table_getter(), {
+                    "year": session["year"],
+                    "contest": session["contest"],
+                    "answers": session["answers"]
+                })
+                session["submitted"] = True
+            return session["result"]
+
+    def random_contest(self):
+        """
+        Pick a random (year, contest) that has a full set of problems.
+        """
+        pipeline = [
+            {"$group": {"_id": {"year": "$year", "contest": "$contest"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gte": NUM_PROBLEMS}}},
+            {"$sample": {"size": 1}}
+        ]
+        for row in self.problems_collection.aggregate(pipeline):
+            return row["_id"]["year"], row["_id"]["contest"]
+        return None
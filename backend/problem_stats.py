@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from pymongo import MongoClient, ASCENDING
+from grading import normalize_choice
+
+# Connect to MongoDB and define collections
+mongo_client = MongoClient("mongodb://localhost:27017")
+db = mongo_client['amc10_test']
+attempts_collection = db['attempts']            # Raw attempt log (source of truth)
+problem_stats_collection = db['problem_stats']  # One materialized document per problem
+student_stats_collection = db['student_stats']  # One materialized document per student
+
+# record_attempt stamps each attempt "applied" once its $inc updates are done. Attempts
+# still unapplied after this long were interrupted (e.g. a crash) and reconcile_stats
+# applies them. The margin keeps reconcile_stats away from requests still in flight.
+RECONCILE_MARGIN_SECONDS = 10 * 60
+
+def ensure_stats_indexes():
+    """
+    Index the unapplied attempts so reconcile_stats only scans those.
+    """
+    attempts_collection.create_index(
+        [("applied", ASCENDING), ("created_at", ASCENDING)],
+        partialFilterExpression={"applied": False}
+    )
+
+def problem_stats_id(year, contest, problem_number):
+    """
+    Stats document _id for a problem, e.g. "2024|AMC 10A|7".
+    Using the key as _id makes every read and update a single primary-key lookup.
+    """
+    return f"{str(year).strip()}|{str(contest).strip()}|{int(problem_number)}"
+
+def apply_attempt(attempt):
+    """
+    Fold one logged attempt into its problem and student stats with atomic $inc upserts.
+    """
+    now = datetime.utcnow()
+    correct = 1 if attempt["is_correct"] else 0
+    problem_stats_collection.update_one(
+        {"_id": problem_stats_id(attempt["year"], attempt["contest"], attempt["problem_number"])},
+        {
+            "$inc": {
+                "attempts": 1,
+                "correct": correct,
+                "total_time_seconds": attempt["time_seconds"],
+                f"answer_counts.{attempt['answer']}": 1
+            },
+            "$set": {"updated_at": now},
+            "$setOnInsert": {"year": attempt["year"], "contest": attempt["contest"], "problem_number": attempt["problem_number"]}
+        },
+        upsert=True
+    )
+    student_stats_collection.update_one(
+        {"_id": attempt["student_id"]},
+        {
+            "$inc": {"attempts": 1, "correct": correct, "total_time_seconds": attempt["time_seconds"]},
+            "$set": {"updated_at": now},
+            "$max": {"last_attempt_at": attempt["created_at"]}
+        },
+        upsert=True
+    )
+
+def record_attempt(student_id, year, contest, problem_number, answer, is_correct, time_seconds):
+    """
+    Log one attempt and fold it into the problem and student stats, so the stats are
+    always current without re-aggregating the log.
+    The attempt is logged with applied: False and stamped applied: True after its $inc
+    updates; reconcile_stats picks up any attempt left unapplied.
+    """
+    attempt = {
+        "student_id": student_id,
+        "year": str(year),
+        "contest": contest,
+        "problem_number": int(problem_number),
+        "answer": normalize_choice(answer) or "blank",
+        "is_correct": bool(is_correct),
+        "time_seconds": max(0.0, float(time_seconds or 0)),
+        "created_at": datetime.utcnow(),
+        "applied": False
+    }
+    attempts_collection.insert_one(attempt)
+    apply_attempt(attempt)
+    attempts_collection.update_one({"_id": attempt["_id"]}, {"$set": {"applied": True}})
+
+def with_derived_fields(stats_doc):
+    """
+    Add solve_rate and average_time_seconds to a stats document.
+    """
+    attempts = stats_doc.get("attempts", 0)
+    stats_doc["solve_rate"] = stats_doc.get("correct", 0) / attempts if attempts else None
+    stats_doc["average_time_seconds"] = stats_doc.get("total_time_seconds", 0) / attempts if attempts else None
+    return stats_doc
+
+def get_problem_stats(year, contest, problem_number):
+    doc = problem_stats_collection.find_one({"_id": problem_stats_id(year, contest, problem_number)})
+    return with_derived_fields(doc) if doc else None
+
+def get_student_stats(student_id):
+    doc = student_stats_collection.find_one({"_id": student_id})
+    return with_derived_fields(doc) if doc else None
+
+def reconcile_stats():
+    """
+    Apply attempts whose $inc updates never completed (the process died between logging
+    the attempt and stamping it applied).
+    Only unapplied attempts older than RECONCILE_MARGIN_SECONDS are read, through the
+    partial index, and each one is claimed atomically (applied: False -> True) before it
+    is applied, so concurrent runs never apply the same attempt twice.
+    The one case this cannot repair is a crash after the $inc but before the stamp, which
+    counts that attempt twice; no transaction spans the log and the stats collections.
+    """
+    ensure_stats_indexes()
+    cutoff = datetime.utcnow() - timedelta(seconds=RECONCILE_MARGIN_SECONDS)
+    applied = 0
+    for attempt in attempts_collection.find({"applied": False, "created_at": {"$lt": cutoff}}, {"_id": 1}):
+        claimed = attempts_collection.find_one_and_update(
+            {"_id": attempt["_id"], "applied": False},
+            {"$set": {"applied": True}}
+        )
+        if claimed is None:
+            continue
+        apply_attempt(claimed)
+        applied += 1
+    print(f"Reconciled stats: applied {applied} interrupted attempts.")
+    return applied
+
+# For direct running, apply any interrupted attempts once.
+if __name__ == "__main__":
+    reconcile_stats()
@@ -0,0 +1,140 @@
+import re
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate if tiktoken is missing.
+    tiktoken = None
+
+# Token budget for the solution text sent in each summary prompt.
+SOLUTION_TOKEN_BUDGET = 800
+TOKENIZER_MODEL = "gpt-4o-mini"
+
+# scrape_solution_page writes section headings as "== Heading ==" lines.
+HEADING_PATTERN = re.compile(r"^==\s*(.*?)\s*==$")
+# Older scrapes have no headings; fall back to "Solution 2" style lines.
+SOLUTION_LINE_PATTERN = re.compile(r"^solution\s*\d*\s*(\(.*\))?$", re.IGNORECASE)
+
+SKIP_SECTION_PREFIXES = ["video", "see also", "problem", "references", "external links"]
+BOILERPLATE_PATTERNS = [
+    re.compile(r"copyrighted by the mathematical association of america", re.IGNORECASE),
+    re.compile(r"american mathematics competitions", re.IGNORECASE),
+    re.compile(r"youtube\.com|youtu\.be|https?://", re.IGNORECASE),
+    re.compile(r"^~\s*\S+$"),  # author signatures, e.g. "~MRENTHUSIASM"
+    re.compile(r"^(video solution|solution)\s*\d*\s*(by .*)?$", re.IGNORECASE)
+]
+
+_encoding = None
+
+def get_encoding():
+    """Load the tokenizer once; returns None if tiktoken is unavailable."""
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except KeyError:
+            _encoding = tiktoken.get_encoding("o200k_base")
+    return _encoding
+
+def count_tokens(text):
+    """Count tokens with the local tokenizer (about 4 characters per token without it)."""
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def truncate_to_tokens(text, budget):
+    """Cut text down to at most budget tokens."""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[:budget * 4]
+    tokens = encoding.encode(text)
+    if len(tokens) <= budget:
+        return text
+    return encoding.decode(tokens[:budget])
+
+def is_boilerplate(line):
+    return any(pattern.search(line) for pattern in BOILERPLATE_PATTERNS)
+
+def split_solutions(raw_solution):
+    """
+    Split a scraped solution page into a list of (heading, text) sections, one per
+    alternate solution. Video, "See Also" and problem-statement sections are dropped.
+    """
+    sections = []
+    heading = ""
+    lines = []
+
+    def flush():
+        if lines:
+            sections.append((heading, "\n".join(lines)))
+
+    for line in raw_solution.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = HEADING_PATTERN.match(line)
+        if match or SOLUTION_LINE_PATTERN.match(line):
+            flush()
+            heading = match.group(1) if match else line
+            lines = []
+            continue
+        lines.append(line)
+    flush()
+
+    solutions = []
+    for heading, text in sections:
+        lowered = heading.lower()
+        if "video" in lowered or any(lowered.startswith(prefix) for prefix in SKIP_SECTION_PREFIXES):
+            continue
+        kept = [line for line in text.splitlines() if not is_boilerplate(line)]
+        if kept:
+            solutions.append((heading, "\n".join(kept)))
+    return solutions
+
+def normalize_for_dedupe(text):
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+def dedupe_solutions(solutions):
+    """
+    Drop solutions whose text is identical to, or contained in, one already kept.
+    """
+    kept = []
+    seen = []
+    for heading, text in solutions:
+        key = normalize_for_dedupe(text)
+        if not key or any(key in other for other in seen):
+            continue
+        # A longer copy replaces any earlier solution it contains.
+        for i in reversed(range(len(seen))):
+            if seen[i] in key:
+                del seen[i]
+                del kept[i]
+        seen.append(key)
+        kept.append((heading, text))
+    return kept
+
+def prepare_solution_prompt(raw_solution, budget=SOLUTION_TOKEN_BUDGET):
+    """
+    Turn a scraped solution page into compact prompt text:
+      1. Split it into individual solutions and drop video/boilerplate sections.
+      2. Remove duplicate solutions.
+      3. Add whole solutions in page order until the token budget is used; if even the
+         first one is too long, truncate it.
+    Returns the prompt text.
+    """
+    solutions = dedupe_solutions(split_solutions(raw_solution))
+    if not solutions:
+        return truncate_to_tokens(raw_solution.strip(), budget)
+
+    parts = []
+    used = 0
+    for index, (heading, text) in enumerate(solutions, start=1):
+        part = f"Solution {index}:\n{text}"
+        tokens = count_tokens(part)
+        if used + tokens > budget:
+            if not parts:
+                parts.append(truncate_to_tokens(part, budget))
+            break
+        parts.append(part)
+        used += tokens
+    return "\n\n".join(parts)
@@ -8,6 +8,7 @@ from scraper import (
     save_problems_to_mongodb,
     save_answer_keys_to_mongodb
 )
+from problem_stats import reconcile_stats
 
 # List of URLs to scrape
 PROBLEM_URLS = [
@@ -52,6 +53,10 @@ if __name__ == "__main__":
     # Schedule the job to run every 6 hours (for example).
     scheduler.add_job(scheduled_scrape, 'interval', hours=6, next_run_time=datetime.now())
 
+    # Apply attempts whose stats updates were interrupted. Only unapplied attempts are
+    # scanned, so this is cheap enough to run often.
+    scheduler.add_job(reconcile_stats, 'interval', minutes=10)
+
     # Start the scheduler.
     scheduler.start()
     
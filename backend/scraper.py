@@ -2,6 +2,7 @@ import requests
 from bs4 import BeautifulSoup
 from pymongo import MongoClient
 import re
+from cache_coherence import publish_invalidation
 
 # URLs for problems and answer key pages
 URL = "https://artofproblemsolving.com/wiki/index.php/2024_AMC_10A_Problems"
@@ -37,9 +38,22 @@ def scrape_solution_page(relative_url):
     if not content_div:
         print("Error: Could not find solution content div.")
         return ""
-    # Gather text from all paragraphs that have content.
-    paragraphs = content_div.find_all("p")
-    solution_text = "\n".join(p.get_text(strip=True) for p in paragraphs if p.get_text(strip=True))
+    # Walk headings and paragraphs in order. Headings are kept as "== Heading ==" lines so
+    # the prompt preparation step can split the page into individual solutions, and
+    # LaTeX images are replaced by their alt text so the math is not lost.
+    lines = []
+    for elem in content_div.find_all(["h2", "h3", "p"]):
+        for img in elem.find_all("img"):
+            img.replace_with(" " + img.get("alt", "") + " ")
+        if elem.name in ("h2", "h3"):
+            heading = elem.get_text(" ", strip=True).replace("[edit]", "").strip()
+            if heading:
+                lines.append(f"== {heading} ==")
+        else:
+            text = " ".join(elem.get_text(" ", strip=True).split())
+            if text:
+                lines.append(text)
+    solution_text = "\n".join(lines)
     return solution_text
 
 def scrape_problems(url):
@@ -287,6 +301,7 @@ def save_problems_to_mongodb(problems):
                 "problem_number": problem.get("problem_number", "")
             }
             problems_collection.insert_one(problem_document)
+            publish_invalidation(db, problems_collection.name, problem_document)
         print(f"Inserted {len(problems)} problems into the database.")
     except Exception as e:
         print(f"Error saving problems to MongoDB: {e}")
@@ -307,6 +322,7 @@ def save_answer_keys_to_mongodb(answer_keys_data):
             "answers": answers
         }
         answer_keys_collection.insert_one(answer_keys_document)
+        publish_invalidation(db, answer_keys_collection.name, answer_keys_document)
         print("Inserted answer keys into the database.")
     except Exception as e:
         print(f"Error saving answer keys to MongoDB: {e}")
@@ -334,7 +350,7 @@ if __name__ == "__main__":
     if problems:
         # Save problems to db['problems'] (without the raw solution).
         for problem in problems:
-            problems_collection.insert_one({
+            problem_document = {
                 "problem_statement": problem.get("problem_statement", ""),
                 "math_images": problem.get("math_images", []),
                 "screenshot_images": problem.get("screenshot_images", []),
@@ -342,7 +358,9 @@ if __name__ == "__main__":
                 "year": problem.get("year", ""),
                 "contest": problem.get("contest", ""),
                 "problem_number": problem.get("problem_number", "")
-            })
+            }
+            problems_collection.insert_one(problem_document)
+            publish_invalidation(db, problems_collection.name, problem_document)
         print(f"Scraped {len(problems)} problems successfully.")
 
         # Extract and save solutions to db['solutions'].
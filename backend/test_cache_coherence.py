@@ -0,0 +1,308 @@
+import time
+import threading
+from pymongo.errors import OperationFailure
+import cache_coherence
+from cache_coherence import CacheInvalidator, publish_invalidation
+from grading import make_problem_key, refresh_contest_answers
+
+
+class FakeCursor(list):
+    def sort(self, field, direction=1):
+        return FakeCursor(sorted(self, key=lambda doc: doc[field], reverse=direction < 0))
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$gt" in condition and not value > condition["$gt"]:
+                return False
+            if "$lte" in condition and not value <= condition["$lte"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    """Just enough of a pymongo collection for publish_invalidation and the poller."""
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(doc for doc in self.docs if matches(doc, query or {}))
+
+    def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        found = [doc for doc in self.docs if matches(doc, query)]
+        if found:
+            doc = found[0]
+        elif upsert:
+            doc = dict(query)
+            self.docs.append(doc)
+        else:
+            return None
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        return doc
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+
+class FakeStream:
+    """
+    Change stream stand-in that replays a fixed list of events. An idle stream then
+    behaves like a quiet server (try_next returns None) instead of failing the test.
+    """
+    def __init__(self, events, idle=False):
+        self.events = list(events)
+        self.idle = idle
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if not self.events:
+            if self.idle:
+                time.sleep(0.001)
+                return None
+            raise AssertionError("stream drained without an invalidate event")
+        event = self.events.pop(0)
+        self.resume_token = {"_data": len(self.events)}
+        return event
+
+
+class FakeDB(dict):
+    def __init__(self, events=None, change_streams=True, errors=None, idle=False):
+        super().__init__()
+        self.events = events or []
+        self.change_streams = change_streams
+        self.errors = list(errors or [])
+        self.idle = idle
+        self.watch_calls = []
+
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+    def watch(self, pipeline, **kwargs):
+        self.watch_calls.append((pipeline, kwargs))
+        if self.errors:
+            raise self.errors.pop(0)
+        if not self.change_streams:
+            raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+        return FakeStream(self.events, idle=self.idle)
+
+
+def make_invalidator(db, *collections, retry_interval=60):
+    invalidator = CacheInvalidator(db, poll_interval=0.01, retry_interval=retry_interval)
+    received = {name: [] for name in collections}
+    for name in collections:
+        invalidator.register(name, received[name].append)
+    return invalidator, received
+
+
+def test_poll_once_dispatches_published_keys():
+    db = FakeDB()
+    invalidator, received = make_invalidator(db, "answer_keys", "problems")
+    invalidator.seen_versions = invalidator.current_versions()
+
+    publish_invalidation(db, "answer_keys", {"year": "2024", "contest": "AMC 10A", "answers": {}})
+    publish_invalidation(db, "problems", {"year": "2024", "contest": "AMC 10A", "problem_number": "7"})
+    invalidator.poll_once()
+
+    assert received["answer_keys"] == [{"year": "2024", "contest": "AMC 10A"}]
+    assert received["problems"] == [{"year": "2024", "contest": "AMC 10A", "problem_number": "7"}]
+
+    # Nothing new: no further dispatches.
+    invalidator.poll_once()
+    assert len(received["answer_keys"]) == 1
+
+
+def test_poll_once_flushes_when_log_has_gaps():
+    db = FakeDB()
+    invalidator, received = make_invalidator(db, "problems")
+    invalidator.seen_versions = {}
+    for number in ("1", "2", "3"):
+        publish_invalidation(db, "problems", {"year": "2024", "contest": "AMC 10A", "problem_number": number})
+    # Simulate an expired log entry.
+    db["cache_invalidations"].docs.pop(0)
+
+    invalidator.poll_once()
+
+    assert received["problems"] == [None]
+    assert invalidator.seen_versions["problems"] == 3
+
+
+def test_poll_once_ignores_unregistered_collections():
+    db = FakeDB()
+    invalidator, received = make_invalidator(db, "problems")
+    invalidator.seen_versions = {}
+    publish_invalidation(db, "solutions", {"year": "2024", "contest": "AMC 10A", "problem_number": "1"})
+
+    invalidator.poll_once()
+
+    assert received["problems"] == []
+
+
+def test_dispatch_isolates_failing_handlers():
+    invalidator, received = make_invalidator(FakeDB(), "problems")
+
+    def broken(key):
+        raise RuntimeError("boom")
+
+    invalidator.handlers["problems"].insert(0, broken)
+    invalidator.dispatch("problems", {"year": "2024"})
+
+    assert received["problems"] == [{"year": "2024"}]
+
+
+def test_change_stream_events_are_dispatched():
+    events = [
+        {"operationType": "insert", "ns": {"coll": "problems"},
+         "fullDocument": {"_id": 1, "year": "2024", "contest": "AMC 10A", "problem_number": "3"}},
+        {"operationType": "delete", "ns": {"coll": "problems"}, "documentKey": {"_id": 1}},
+        {"operationType": "drop", "ns": {"coll": "answer_keys"}},
+        {"operationType": "invalidate"},
+    ]
+    db = FakeDB(events)
+    invalidator, received = make_invalidator(db, "problems", "answer_keys")
+
+    invalidator.watch_change_stream()
+
+    assert received["problems"] == [{"year": "2024", "contest": "AMC 10A", "problem_number": "3"}, None, None]
+    assert received["answer_keys"] == [None, None]
+    assert invalidator.mode == "change_stream"
+    # A stream cannot be resumed past an invalidate event.
+    assert invalidator.resume_token is None
+    pipeline, kwargs = db.watch_calls[0]
+    assert set(pipeline[0]["$match"]["ns.coll"]["$in"]) == {"problems", "answer_keys"}
+    assert kwargs["full_document"] == "updateLookup"
+
+
+def test_falls_back_to_polling_without_replica_set():
+    db = FakeDB(change_streams=False)
+    invalidator, received = make_invalidator(db, "problems")
+    delivered = threading.Event()
+    invalidator.register("problems", lambda key: key and delivered.set())
+
+    invalidator.start()
+    try:
+        # Wait for the poller to record the starting versions before publishing.
+        for _ in range(200):
+            if invalidator.mode == "polling":
+                break
+            threading.Event().wait(0.01)
+        threading.Event().wait(0.05)
+        publish_invalidation(db, "problems", {"year": "2024", "contest": "AMC 10A", "problem_number": "9"})
+        assert delivered.wait(2)
+    finally:
+        invalidator.stop()
+
+    assert invalidator.mode == "polling"
+    # Falling back flushes everything first, since changes may have been missed.
+    assert received["problems"] == [None, {"year": "2024", "contest": "AMC 10A", "problem_number": "9"}]
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_history_lost_restarts_the_stream_instead_of_polling():
+    history_lost = OperationFailure("Resume point is no longer in the oplog", code=286)
+    db = FakeDB(errors=[history_lost], idle=True)
+    invalidator, received = make_invalidator(db, "problems")
+    invalidator.resume_token = {"_data": 5}
+
+    invalidator.start()
+    try:
+        assert wait_for(lambda: invalidator.mode == "change_stream")
+    finally:
+        invalidator.stop()
+
+    assert received["problems"] == [None]
+    assert [kwargs["resume_after"] for _, kwargs in db.watch_calls] == [{"_data": 5}, None]
+
+
+def test_other_operation_failures_do_not_switch_to_polling():
+    denied = OperationFailure("not authorized", code=13)
+    db = FakeDB(errors=[denied, denied], idle=True)
+    invalidator, received = make_invalidator(db, "problems")
+
+    invalidator.start()
+    try:
+        assert wait_for(lambda: invalidator.mode == "change_stream")
+    finally:
+        invalidator.stop()
+
+    assert len(db.watch_calls) == 3
+    assert received["problems"] == [None, None]
+
+
+def test_polling_retries_change_streams():
+    db = FakeDB(change_streams=False, idle=True)
+    invalidator, received = make_invalidator(db, "problems", retry_interval=0.05)
+    key = {"year": "2024", "contest": "AMC 10A", "problem_number": "4"}
+
+    invalidator.start()
+    try:
+        assert wait_for(lambda: invalidator.mode == "polling")
+        publish_invalidation(db, "problems", key)
+        db.change_streams = True
+        assert wait_for(lambda: invalidator.mode == "change_stream")
+    finally:
+        invalidator.stop()
+
+    # One flush on falling back; retries that stay in polling keep their state, and the
+    # published key arrives exactly once whether the poller or the stream opening saw it.
+    assert received["problems"] == [None, key]
+    assert len(db.watch_calls) >= 2
+
+
+class RecordingTable(dict):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.deleted = []
+
+    def __delitem__(self, key):
+        self.deleted.append(key)
+        super().__delitem__(key)
+
+
+def test_refresh_contest_answers_never_removes_current_answers():
+    answer_keys = FakeCollection()
+    answer_keys.docs.append({"year": "2024", "contest": "AMC 10A", "answers": {"Problem 1": "B", "Problem 2": "C"}})
+    table = RecordingTable({
+        make_problem_key("2024", "AMC 10A", 1): "A",
+        make_problem_key("2024", "AMC 10A", 2): "C",
+        make_problem_key("2024", "AMC 10A", 3): "D",
+        make_problem_key("2024", "AMC 10B", 1): "E",
+    })
+
+    refresh_contest_answers(table, answer_keys, "2024", "AMC 10A")
+
+    assert table.deleted == [make_problem_key("2024", "AMC 10A", 3)]
+    assert table == {
+        make_problem_key("2024", "AMC 10A", 1): "B",
+        make_problem_key("2024", "AMC 10A", 2): "C",
+        make_problem_key("2024", "AMC 10B", 1): "E",
+    }
+
+
+def test_cache_key_keeps_only_identifying_fields():
+    doc = {"_id": 1, "year": "2024", "contest": "AMC 10A", "problem_number": None, "answers": {}}
+    assert cache_coherence.cache_key(doc) == {"year": "2024", "contest": "AMC 10A"}
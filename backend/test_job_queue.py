@@ -0,0 +1,261 @@
+import itertools
+from datetime import datetime, timedelta
+import pytest
+import job_queue
+import adaptive_worker
+from adaptive_learning import AdaptiveGenerationError
+from job_queue import DEAD, DONE, MAX_ATTEMPTS, PENDING, RUNNING
+
+
+class Result:
+    def __init__(self, modified_count=0, upserted_id=None):
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+
+
+def matches(doc, query):
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+            continue
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$lt" in condition and (value is None or not value < condition["$lt"]):
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def apply_update(doc, update):
+    for field, value in update.get("$set", {}).items():
+        doc[field] = value
+    for field, amount in update.get("$inc", {}).items():
+        doc[field] = doc.get(field, 0) + amount
+
+
+class FakeJobsCollection:
+    """Just enough of a pymongo collection for the job queue."""
+    def __init__(self):
+        self.docs = []
+        self.ids = itertools.count(1)
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find(self, query=None):
+        return [doc for doc in self.docs if matches(doc, query or {})]
+
+    def find_one(self, query):
+        found = self.find(query)
+        return dict(found[0]) if found else None
+
+    def update_one(self, query, update, upsert=False):
+        found = self.find(query)
+        if found:
+            apply_update(found[0], update)
+            return Result(modified_count=1)
+        if upsert:
+            doc = {"_id": next(self.ids), **query, **update.get("$setOnInsert", {})}
+            apply_update(doc, update)
+            self.docs.append(doc)
+            return Result(upserted_id=doc["_id"])
+        return Result()
+
+    def update_many(self, query, update):
+        found = self.find(query)
+        for doc in found:
+            apply_update(doc, update)
+        return Result(modified_count=len(found))
+
+    def find_one_and_update(self, query, update, sort=None, return_document=None):
+        found = self.find(query)
+        for field, direction in reversed(sort or []):
+            found.sort(key=lambda doc: doc[field], reverse=direction < 0)
+        if not found:
+            return None
+        apply_update(found[0], update)
+        return dict(found[0])
+
+
+class FakeAdaptiveCollection:
+    def __init__(self, docs=None):
+        self.docs = docs or []
+
+    def find_one(self, query):
+        for doc in self.docs:
+            if matches(doc, query):
+                return doc
+        return None
+
+
+METADATA = {"year": "2024", "contest": "AMC 10A", "problem_number": "7", "problem_text": "What is 1+1?"}
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    collection = FakeJobsCollection()
+    monkeypatch.setattr(job_queue, "jobs_collection", collection)
+    monkeypatch.setattr(adaptive_worker, "adaptive_collection", FakeAdaptiveCollection())
+    # Keep heartbeat threads from firing during process_job tests.
+    monkeypatch.setattr(adaptive_worker, "HEARTBEAT_SECONDS", 60)
+    return collection
+
+
+def expire_lease(jobs, job_id):
+    doc = jobs.find({"_id": job_id})[0]
+    doc["lease_expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+
+
+def test_enqueue_is_idempotent(jobs):
+    assert job_queue.enqueue_job(METADATA) is True
+    assert job_queue.enqueue_job(METADATA) is False
+    assert len(jobs.docs) == 1
+    assert jobs.docs[0]["status"] == PENDING
+
+
+def test_claim_takes_oldest_pending_job(jobs):
+    job_queue.enqueue_job(METADATA)
+    job_queue.enqueue_job({**METADATA, "problem_number": "8"})
+    jobs.docs[1]["created_at"] = jobs.docs[0]["created_at"] - timedelta(seconds=5)
+
+    job = job_queue.claim_job("worker-a")
+
+    assert job["payload"]["problem_number"] == "8"
+    assert job["status"] == RUNNING
+    assert job["lease_owner"] == "worker-a"
+    assert job["attempts"] == 1
+
+
+def test_live_lease_is_not_reclaimed(jobs):
+    job_queue.enqueue_job(METADATA)
+    job_queue.claim_job("worker-a")
+
+    assert job_queue.claim_job("worker-b") is None
+
+
+def test_expired_lease_is_reclaimed_and_old_owner_loses_it(jobs):
+    job_queue.enqueue_job(METADATA)
+    job = job_queue.claim_job("worker-a")
+    expire_lease(jobs, job["_id"])
+
+    reclaimed = job_queue.claim_job("worker-b")
+
+    assert reclaimed["_id"] == job["_id"]
+    assert reclaimed["lease_owner"] == "worker-b"
+    assert reclaimed["attempts"] == 2
+    # The crashed/stalled worker can no longer extend, finish or fail the job.
+    assert job_queue.heartbeat(job["_id"], "worker-a") is False
+    assert job_queue.complete_job(job["_id"], "worker-a") is False
+    assert job_queue.fail_job(job, "worker-a", "late") is None
+    assert job_queue.heartbeat(job["_id"], "worker-b") is True
+
+
+def test_heartbeat_extends_lease(jobs):
+    job_queue.enqueue_job(METADATA)
+    job = job_queue.claim_job("worker-a")
+    expire_lease(jobs, job["_id"])
+
+    assert job_queue.heartbeat(job["_id"], "worker-a") is True
+    assert job_queue.claim_job("worker-b") is None
+
+
+def test_fail_job_retries_then_dead_letters(jobs):
+    job_queue.enqueue_job(METADATA)
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        job = job_queue.claim_job("worker-a")
+        assert job["attempts"] == attempt
+        status = job_queue.fail_job(job, "worker-a", "OpenAI error")
+        assert status == (DEAD if attempt == MAX_ATTEMPTS else PENDING)
+
+    assert job_queue.claim_job("worker-a") is None
+    assert jobs.docs[0]["last_error"] == "OpenAI error"
+    assert job_queue.requeue_dead_jobs() == 1
+    assert jobs.docs[0]["status"] == PENDING
+    assert jobs.docs[0]["attempts"] == 0
+
+
+def test_process_job_dead_letters_after_repeated_crashes(jobs, monkeypatch):
+    calls = []
+    monkeypatch.setattr(adaptive_worker, "pre_generate_adaptive_data", lambda *a, **k: calls.append(a))
+    job_queue.enqueue_job(METADATA)
+    for _ in range(MAX_ATTEMPTS):
+        job = job_queue.claim_job("worker-a")
+        expire_lease(jobs, job["_id"])  # the worker "crashes" without reporting
+
+    job = job_queue.claim_job("worker-b")
+    assert job["attempts"] == MAX_ATTEMPTS + 1
+    adaptive_worker.process_job(job, "worker-b")
+
+    assert calls == []
+    assert jobs.docs[0]["status"] == DEAD
+
+
+def test_process_job_completes(jobs, monkeypatch):
+    monkeypatch.setattr(adaptive_worker, "pre_generate_adaptive_data", lambda metadata, raise_on_error: "adaptive-1")
+    job_queue.enqueue_job(METADATA)
+
+    adaptive_worker.process_job(job_queue.claim_job("worker-a"), "worker-a")
+
+    assert jobs.docs[0]["status"] == DONE
+    assert jobs.docs[0]["lease_owner"] is None
+
+
+def test_process_job_failure_goes_back_to_pending(jobs, monkeypatch):
+    def failing(metadata, raise_on_error):
+        assert raise_on_error is True
+        raise AdaptiveGenerationError("2 of 6 OpenAI calls failed.")
+
+    monkeypatch.setattr(adaptive_worker, "pre_generate_adaptive_data", failing)
+    job_queue.enqueue_job(METADATA)
+
+    adaptive_worker.process_job(job_queue.claim_job("worker-a"), "worker-a")
+
+    assert jobs.docs[0]["status"] == PENDING
+    assert "OpenAI" in jobs.docs[0]["last_error"]
+
+
+def test_process_job_after_lost_lease_leaves_job_to_new_owner(jobs, monkeypatch):
+    job_queue.enqueue_job(METADATA)
+    job = job_queue.claim_job("worker-a")
+
+    def slow_generation(metadata, raise_on_error):
+        # While worker-a is generating, its lease expires and worker-b takes over.
+        expire_lease(jobs, job["_id"])
+        assert job_queue.claim_job("worker-b") is not None
+        return "adaptive-1"
+
+    monkeypatch.setattr(adaptive_worker, "pre_generate_adaptive_data", slow_generation)
+    adaptive_worker.process_job(job, "worker-a")
+
+    assert jobs.docs[0]["status"] == RUNNING
+    assert jobs.docs[0]["lease_owner"] == "worker-b"
+
+
+def test_process_job_skips_complete_adaptive_data(jobs, monkeypatch):
+    existing = {**METADATA, "solution_summaries": ["ok"], "followup_questions": {"easy": "ok"}}
+    monkeypatch.setattr(adaptive_worker, "adaptive_collection", FakeAdaptiveCollection([existing]))
+    monkeypatch.setattr(adaptive_worker, "pre_generate_adaptive_data",
+                        lambda *a, **k: pytest.fail("should not regenerate"))
+    job_queue.enqueue_job(METADATA)
+
+    adaptive_worker.process_job(job_queue.claim_job("worker-a"), "worker-a")
+
+    assert jobs.docs[0]["status"] == DONE
+
+
+def test_process_job_regenerates_placeholder_documents(jobs, monkeypatch):
+    broken = {**METADATA, "solution_summaries": [adaptive_worker.SUMMARY_ERROR_TEXT], "followup_questions": {}}
+    monkeypatch.setattr(adaptive_worker, "adaptive_collection", FakeAdaptiveCollection([broken]))
+    calls = []
+    monkeypatch.setattr(adaptive_worker, "pre_generate_adaptive_data",
+                        lambda metadata, raise_on_error: calls.append(metadata) or "adaptive-1")
+    job_queue.enqueue_job(METADATA)
+
+    adaptive_worker.process_job(job_queue.claim_job("worker-a"), "worker-a")
+
+    assert len(calls) == 1
+    assert jobs.docs[0]["status"] == DONE
@@ -0,0 +1,101 @@
+import pytest
+import adaptive_learning
+from adaptive_learning import ReviewScheduleCache, SpacedRepetitionScheduler
+
+DAY = SpacedRepetitionScheduler.DAY_SECONDS
+
+
+class FakeSchedules:
+    """Just enough of db['review_schedules'] for the schedule cache."""
+    def __init__(self):
+        self.docs = {}
+        self.full_reads = 0
+
+    def find_one(self, query, projection=None):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        if projection:
+            return {"_id": doc["_id"], "version": doc.get("version", 0)}
+        self.full_reads += 1
+        return {"_id": doc["_id"], "version": doc.get("version", 0), "cards": dict(doc["cards"])}
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "cards": {}})
+        for field, value in update["$set"].items():
+            doc["cards"][field[len("cards."):]] = value
+        doc["version"] = doc.get("version", 0) + update["$inc"]["version"]
+        return {"_id": doc["_id"], "version": doc["version"]}
+
+
+@pytest.fixture
+def schedules(monkeypatch):
+    collection = FakeSchedules()
+    monkeypatch.setattr(adaptive_learning, "review_schedules_collection", collection)
+    return collection
+
+
+def test_cache_serves_own_writes_without_reloading(schedules):
+    cache = ReviewScheduleCache()
+    assert cache.review("s1", "2024|AMC 10A|7", False, now=0) == DAY
+    assert cache.review("s1", "2024|AMC 10A|8", False, now=10) == 10 + DAY
+
+    assert cache.next_due("s1", now=2 * DAY) == "2024|AMC 10A|7"
+    assert schedules.full_reads == 0
+    assert schedules.docs["s1"]["version"] == 2
+
+
+def test_cache_reloads_after_another_process_writes(schedules):
+    cache = ReviewScheduleCache()
+    other = ReviewScheduleCache()
+    cache.review("s1", "2024|AMC 10A|7", False, now=100)
+    other.review("s1", "2024|AMC 10A|3", False, now=0)
+    schedules.full_reads = 0
+
+    assert cache.next_due("s1", now=2 * DAY) == "2024|AMC 10A|3"
+    assert schedules.full_reads == 1
+
+
+def test_cache_drops_least_recently_used_students(schedules):
+    cache = ReviewScheduleCache(capacity=2)
+    for student in ("s1", "s2", "s3"):
+        cache.review(student, "2024|AMC 10A|7", False, now=0)
+
+    assert list(cache.versions) == ["s2", "s3"]
+    assert "s1" not in cache.scheduler.cards
+    assert cache.next_due("s1", now=2 * DAY) == "2024|AMC 10A|7"
+
+
+def test_load_attempts_streams_one_student_at_a_time():
+    scheduler = SpacedRepetitionScheduler()
+    in_memory = []
+    attempts = [
+        {"student_id": "a", "card_key": "k1", "is_correct": False, "timestamp": 0},
+        {"student_id": "a", "card_key": "k1", "is_correct": True, "timestamp": DAY},
+        {"student_id": "b", "card_key": "k2", "is_correct": True, "timestamp": 0},
+        {"student_id": "c", "card_key": "k3", "is_correct": False, "timestamp": 5},
+    ]
+
+    def on_loaded(student_id):
+        in_memory.append(sorted(scheduler.cards))
+        scheduler.evict(student_id)
+
+    assert scheduler.load_attempts(iter(attempts), on_loaded=on_loaded) == 2
+    # "b" only answered correctly and has nothing to review.
+    assert in_memory == [["a"], ["c"]]
+    assert not scheduler.cards
+
+
+def test_load_attempts_rejects_unsorted_history():
+    scheduler = SpacedRepetitionScheduler()
+    with pytest.raises(ValueError):
+        scheduler.load_attempts([
+            {"student_id": "a", "card_key": "k1", "is_correct": False, "timestamp": 10},
+            {"student_id": "a", "card_key": "k1", "is_correct": False, "timestamp": 5},
+        ])
+    with pytest.raises(ValueError):
+        scheduler.load_attempts([
+            {"student_id": "a", "card_key": "k1", "is_correct": False, "timestamp": 0},
+            {"student_id": "b", "card_key": "k1", "is_correct": False, "timestamp": 0},
+            {"student_id": "a", "card_key": "k2", "is_correct": False, "timestamp": 1},
+        ])
@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+import random
+import argparse
+import bson
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import adaptive_learning
+from adaptive_learning import ReviewScheduleCache, SpacedRepetitionScheduler
+
+class InMemorySchedules:
+    """
+    Stand-in for db['review_schedules'] with the same wire costs on the client: full reads
+    are BSON-decoded, projected version reads are not. Server-side work is not timed.
+    """
+    def __init__(self):
+        self.docs = {}
+        self.encoded = {}
+
+    def find_one(self, query, projection=None):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            return None
+        if projection:
+            return {"_id": doc["_id"], "version": doc.get("version", 0)}
+        if query["_id"] not in self.encoded:
+            self.encoded[query["_id"]] = bson.encode(doc)
+        return bson.decode(self.encoded[query["_id"]])
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "cards": {}})
+        for field, value in update.get("$set", {}).items():
+            if field.startswith("cards."):
+                doc["cards"][field[len("cards."):]] = value
+            else:
+                doc[field] = value
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        self.encoded.pop(query["_id"], None)
+        return doc
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        doc = self.update_one(query, update, upsert)
+        return {"_id": doc["_id"], "version": doc["version"]}
+
+def synthetic_doc(student_id, num_cards, now, rng):
+    """Build a persisted schedule document with num_cards cards due over the next 60 days."""
+    scheduler = SpacedRepetitionScheduler()
+    cards = scheduler.cards[student_id]
+    for i in range(num_cards):
+        interval = rng.choice([1.0, 6.0, 15.0, 37.5])
+        due = int(now + rng.uniform(-2, 60) * SpacedRepetitionScheduler.DAY_SECONDS)
+        cards[f"{2000 + i // 50}|AMC 10{'AB'[i // 25 % 2]}|{i % 25 + 1}"] = [due, interval, 2.5, rng.randint(0, 5)]
+    return scheduler.to_doc(student_id)
+
+def run(num_students, num_cards, ops_per_student, batch_size, seed):
+    """
+    Simulate num_students students with num_cards cards each.
+    Students are processed in batches, as the app does: load a persisted schedule,
+    serve next-due lookups and reviews, persist it again, then evict it from memory.
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    # Reuse a small pool of persisted documents so generation time doesn't dominate.
+    pool = [synthetic_doc(f"template-{i}", num_cards, now, rng) for i in range(8)]
+    doc_bytes = sum(sum(len(field) + len(packed) for field, packed in doc["cards"].items()) for doc in pool) / len(pool)
+
+    load_time = op_time = save_time = 0.0
+    ops = 0
+    for start in range(0, num_students, batch_size):
+        scheduler = SpacedRepetitionScheduler()
+        batch = range(start, min(start + batch_size, num_students))
+
+        t0 = time.perf_counter()
+        for student in batch:
+            template = pool[student % len(pool)]
+            scheduler.load_doc({"_id": student, "cards": template["cards"]})
+        t1 = time.perf_counter()
+        for student in batch:
+            for _ in range(ops_per_student):
+                card_key = scheduler.next_due(student, now)
+                if card_key is None:
+                    break
+                scheduler.review(student, card_key, rng.random() < 0.7, now)
+                ops += 1
+        t2 = time.perf_counter()
+        for student in batch:
+            scheduler.to_doc(student)
+        t3 = time.perf_counter()
+
+        load_time += t1 - t0
+        op_time += t2 - t1
+        save_time += t3 - t2
+        done = batch.stop
+        print(f"{done}/{num_students} students, {ops} reviews, {op_time / max(ops, 1) * 1e6:.1f} us/review")
+
+    total_cards = num_students * num_cards
+    print("==== Spaced repetition benchmark ====")
+    print(f"Students: {num_students}, cards per student: {num_cards}, total cards: {total_cards}")
+    print(f"Persisted size: {doc_bytes / num_cards:.1f} bytes/card, {doc_bytes / 1024:.1f} KiB/student")
+    print(f"Load + heapify: {load_time:.2f}s ({load_time / total_cards * 1e9:.0f} ns/card)")
+    print(f"Next-due + review: {ops} ops in {op_time:.2f}s ({op_time / max(ops, 1) * 1e6:.1f} us/op)")
+    print(f"Serialize: {save_time:.2f}s ({save_time / num_students * 1e3:.2f} ms/student)")
+
+def synthetic_history(num_students, attempts_per_student, now, rng):
+    """
+    Yield attempts grouped by student and in time order, as the sorted attempts cursor in
+    rebuild_review_schedules does. About a third of the answers are misses.
+    """
+    for student in range(num_students):
+        start = now - 365 * SpacedRepetitionScheduler.DAY_SECONDS
+        for i in range(attempts_per_student):
+            yield {
+                "student_id": student,
+                "card_key": f"{2000 + i // 50 % 25}|AMC 10{'AB'[i // 25 % 2]}|{i % 25 + 1}",
+                "is_correct": rng.random() < 0.67,
+                "timestamp": start + i * 600
+            }
+
+def run_history(num_students, attempts_per_student, seed):
+    """
+    Bulk load from attempt history the way rebuild_review_schedules does: stream the
+    attempts, heapify each student once, persist (BSON-encode) and evict.
+    """
+    rng = random.Random(seed)
+    scheduler = SpacedRepetitionScheduler()
+    encoded_bytes = 0
+
+    def save_and_evict(student_id):
+        nonlocal encoded_bytes
+        encoded_bytes += len(bson.encode(scheduler.to_doc(student_id)))
+        scheduler.evict(student_id)
+
+    history = list(synthetic_history(num_students, attempts_per_student, time.time(), rng))
+    t0 = time.perf_counter()
+    loaded = scheduler.load_attempts(history, on_loaded=save_and_evict)
+    elapsed = time.perf_counter() - t0
+    total = num_students * attempts_per_student
+    print("==== Bulk load from attempt history ====")
+    print(f"Students: {num_students}, attempts: {total}, schedules built: {loaded}")
+    print(f"Replay + heapify + encode: {elapsed:.2f}s ({elapsed / total * 1e9:.0f} ns/attempt), "
+          f"{encoded_bytes / max(loaded, 1) / 1024:.1f} KiB BSON/student, {len(scheduler.cards)} schedules left in memory")
+
+def run_requests(num_students, num_cards, num_requests, seed):
+    """
+    Per-request cost of the app's /attempts and /reviews/next paths against a stored
+    schedule: reloading the whole document per request versus ReviewScheduleCache.
+    """
+    rng = random.Random(seed)
+    now = time.time()
+    store = InMemorySchedules()
+    for student in range(num_students):
+        doc = synthetic_doc(student, num_cards, now, rng)
+        doc["version"] = 1
+        store.docs[student] = doc
+    adaptive_learning.review_schedules_collection = store
+    students = [rng.randrange(num_students) for _ in range(num_requests)]
+
+    t0 = time.perf_counter()
+    for student in students:
+        scheduler = SpacedRepetitionScheduler()
+        doc = store.find_one({"_id": student})
+        scheduler.load_doc(doc)
+        scheduler.next_due(student, now)
+    reload_time = time.perf_counter() - t0
+    doc_bytes = len(store.encoded[students[0]])
+
+    cache = ReviewScheduleCache(capacity=num_students)
+    for student in range(num_students):
+        cache.next_due(student, now)  # warm up
+    t0 = time.perf_counter()
+    for i, student in enumerate(students):
+        card_key = cache.next_due(student, now)
+        if card_key is not None and i % 2:
+            cache.review(student, card_key, rng.random() < 0.7, now)
+    cached_time = time.perf_counter() - t0
+
+    print("==== Per-request schedule access ====")
+    print(f"Students: {num_students}, cards per student: {num_cards}, requests: {num_requests}")
+    print(f"Reload per request: {reload_time / num_requests * 1e6:.0f} us/request, {doc_bytes / 1024:.1f} KiB BSON read")
+    print(f"ReviewScheduleCache (version check + heap, half with a card save): "
+          f"{cached_time / num_requests * 1e6:.1f} us/request")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the spaced-repetition review scheduler.")
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--cards", type=int, default=2000)
+    parser.add_argument("--ops", type=int, default=20, help="Next-due lookups and reviews per student.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Students held in memory at once.")
+    parser.add_argument("--history-students", type=int, default=2000,
+                        help="Students replayed from attempt history (one attempt per card).")
+    parser.add_argument("--request-students", type=int, default=200,
+                        help="Stored schedules hit by the per-request benchmark.")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.students, args.cards, args.ops, args.batch_size, args.seed)
+    run_history(args.history_students, args.cards, args.seed)
+    run_requests(args.request_students, args.cards, args.requests, args.seed)
@@ -1,11 +1,22 @@
 import requests
 from bs4 import BeautifulSoup
+import argparse
+import gzip
+import io
 import json
+import os
 import random
+import re
+
+try:
+    import zstandard
+except ImportError:  # zstd exports are optional; gzip is always available.
+    zstandard = None
 
 URL = "https://artofproblemsolving.com/wiki/index.php/2024_AMC_10A_Problems"
 LATEX_BASE_URL = "https:"  # Ensure LaTeX images are absolute URLs
 WIKI_IMAGE_BASE_URL = "https:"  # Ensure Screenshot images are absolute URLs
+PROBLEMS_URL_TEMPLATE = "https://artofproblemsolving.com/wiki/index.php/{year}_{contest}_Problems"
 
 def scrape_problems(url):
     """Scrape problems and correctly capture LaTeX math and large screenshots."""
@@ -98,9 +109,165 @@ def save_problems_to_json(problems, filename="scraped_data/amc_10a_2024_problems
     with open(filename, "w", encoding="utf-8") as f:
         json.dump(problems, f, indent=4, ensure_ascii=False)
 
+def problems_url(year, contest):
+    """Build the AoPS problems page URL for a contest, e.g. (2024, "AMC 10A")."""
+    return PROBLEMS_URL_TEMPLATE.format(year=year, contest=contest.replace(" ", "_"))
+
+def add_problem_metadata(problems, year, contest):
+    """
+    Attach year, contest and problem_number (parsed from the title) to each problem.
+    Sections whose title has no problem number (e.g. "See also") are dropped, since they
+    cannot be keyed in the sidecar index.
+    """
+    numbered = []
+    for problem in problems:
+        match = re.search(r"Problem\s+(\d+)", problem.get("title", ""))
+        if not match:
+            continue
+        problem["year"] = str(year)
+        problem["contest"] = contest
+        problem["problem_number"] = match.group(1)
+        numbered.append(problem)
+    return numbered
+
+def index_path_for(path):
+    """Sidecar index file that sits next to a streaming export."""
+    return path + ".idx"
+
+def compression_for(path):
+    """Pick the compression format from the file extension (.gz or .zst)."""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed; use a .gz path or pip install zstandard.")
+        return "zstd"
+    if path.endswith(".gz"):
+        return "gzip"
+    raise ValueError(f"Unsupported export extension for {path}; expected .jsonl.gz or .jsonl.zst")
+
+def compress_frame(data, compression):
+    """Compress one contest's JSON lines as a standalone gzip member / zstd frame."""
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+def decompress_frame(data, compression):
+    """Inverse of compress_frame."""
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def append_contest_to_stream(problems, path, year, contest):
+    """
+    Append one contest's problems to a compressed JSON lines export.
+    Each contest is written as its own gzip member / zstd frame, so the file stays a valid
+    single stream for sequential readers while the sidecar index can seek straight to a
+    contest. One index line is appended per contest:
+      {"year", "contest", "offset", "length", "problems": [problem_number, ...]}
+    """
+    compression = compression_for(path)
+    lines = [json.dumps(problem, ensure_ascii=False) for problem in problems]
+    frame = compress_frame(("\n".join(lines) + "\n").encode("utf-8"), compression)
+    with open(path, "ab") as f:
+        offset = f.tell()
+        f.write(frame)
+    index_entry = {
+        "year": str(year),
+        "contest": contest,
+        "offset": offset,
+        "length": len(frame),
+        "problems": [problem.get("problem_number") for problem in problems]
+    }
+    with open(index_path_for(path), "a", encoding="utf-8") as f:
+        f.write(json.dumps(index_entry, ensure_ascii=False) + "\n")
+
+def stream_contests_to_jsonl(contests, path):
+    """
+    Scrape each (year, contest) pair and append it to a compressed JSON lines export as
+    soon as it is scraped, so memory use is bounded by a single contest.
+    Returns the number of problems written.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    total = 0
+    for year, contest in contests:
+        url = problems_url(year, contest)
+        problems = scrape_problems(url)
+        if not problems:
+            print(f"No problems scraped from {url}.")
+            continue
+        problems = add_problem_metadata(problems, year, contest)
+        if not problems:
+            print(f"No numbered problems found at {url}.")
+            continue
+        append_contest_to_stream(problems, path, year, contest)
+        total += len(problems)
+        print(f"Wrote {len(problems)} problems for {year} {contest} to {path}.")
+    return total
+
+def load_stream_index(path):
+    """
+    Read the sidecar index into a dict keyed by (year, contest, problem_number).
+    Values are (offset, length, line) for the frame holding that problem.
+    """
+    index = {}
+    with open(index_path_for(path), "r", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            for line_no, problem_number in enumerate(entry["problems"]):
+                key = (entry["year"], entry["contest"], problem_number)
+                index[key] = (entry["offset"], entry["length"], line_no)
+    return index
+
+def iter_problems_jsonl(path):
+    """Lazily yield problems from a compressed JSON lines export, one line at a time."""
+    if compression_for(path) == "zstd":
+        with open(path, "rb") as raw:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def read_problem(path, year, contest, problem_number, index=None):
+    """
+    Random access to a single problem: seek to its contest's frame using the sidecar index
+    and decompress only that frame. Pass a preloaded index to avoid re-reading it.
+    Returns None if the problem is not in the export.
+    """
+    if index is None:
+        index = load_stream_index(path)
+    location = index.get((str(year), contest, str(problem_number)))
+    if location is None:
+        return None
+    offset, length, line_no = location
+    with open(path, "rb") as f:
+        f.seek(offset)
+        frame = f.read(length)
+    # Split on "\n" only: json.dumps(ensure_ascii=False) leaves U+2028, U+0085 etc. unescaped,
+    # and str.splitlines() would treat them as line breaks too.
+    lines = decompress_frame(frame, compression_for(path)).decode("utf-8").split("\n")
+    return json.loads(lines[line_no])
+
 if __name__ == "__main__":
-    problems = scrape_problems(URL)
-    if problems:
-        random.shuffle(problems)  # Shuffle before saving
-        save_problems_to_json(problems)
-        print(f"Scraped {len(problems)} problems successfully.")
+    parser = argparse.ArgumentParser(description="Scrape AMC problems from AoPS.")
+    parser.add_argument("--stream", metavar="PATH",
+                        help="Stream a compressed JSON lines export (.jsonl.gz or .jsonl.zst) instead of a single JSON file.")
+    parser.add_argument("--years", nargs="+", default=["2024"], help="Contest years to scrape in streaming mode.")
+    parser.add_argument("--contests", nargs="+", default=["AMC 10A"], help="Contest names to scrape in streaming mode.")
+    args = parser.parse_args()
+
+    if args.stream:
+        contests = [(year, contest) for year in args.years for contest in args.contests]
+        total = stream_contests_to_jsonl(contests, args.stream)
+        print(f"Streamed {total} problems to {args.stream}.")
+    else:
+        problems = scrape_problems(URL)
+        if problems:
+            random.shuffle(problems)  # Shuffle before saving
+            save_problems_to_json(problems)
+            print(f"Scraped {len(problems)} problems successfully.")